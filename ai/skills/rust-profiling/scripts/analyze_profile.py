@@ -6,13 +6,25 @@ Analyzes Firefox Profiler JSON files (from samply) to identify performance bottl
 
 Features:
   - Self time and total time analysis
-  - Call tree visualization
+  - Call tree visualization (top-down and inverted)
   - Caller/callee relationships
-  - Library breakdown
+  - Library breakdown and crate/module roll-ups
+  - Per source line and per instruction address hotspots
+  - Weighted and CPU-time aware sample aggregation
   - Rust symbol demangling
-  - Filtering by library or threshold
+  - Inline-aware attribution (expand or collapse inlined frames)
+  - Filtering by library, threshold or time window
+  - Thread pools grouped by name pattern
+  - Timeline histogram of hot functions
+  - Aggregation and comparison of repeated runs
+  - Interactive shell for repeated queries
   - JSON output for automation
+  - Full-table export to SQLite or Parquet for queries across captures
+  - Collapsed-stack export for flame graph tools
   - Diff mode for comparing profiles
+  - Streaming loader for multi-gigabyte profiles
+  - Transparent gzip/zstd decompression
+  - On-disk cache of analysis results for repeat queries
 
 Usage:
   analyze_profile.py profile.json                    # Basic analysis
@@ -20,55 +32,1211 @@ Usage:
   analyze_profile.py profile.json --lib mylib        # Filter to specific library
   analyze_profile.py profile.json --callers main     # Show callers of 'main'
   analyze_profile.py profile.json --tree             # Show call tree
+  analyze_profile.py profile.json --inverted         # Bottom-up tree from hot leaves
+  analyze_profile.py profile.json --lines parse      # Hot source lines within 'parse'
+  analyze_profile.py profile.json --crates           # Time by crate and module
+  analyze_profile.py profile.json --group-threads    # worker-1..N as one pool
   analyze_profile.py profile.json --json             # Output as JSON
+  analyze_profile.py runs/*.json --export runs.db    # Append full tables to SQLite
+  analyze_profile.py profile.json --folded out.folded  # Flame graph input
+  analyze_profile.py profile.json --weight cpu       # Weight by thread CPU time
+  analyze_profile.py profile.json --inline collapse  # Fold inlined callees into callers
+  analyze_profile.py profile.json --from 12 --to 16  # Only samples in a time window
+  analyze_profile.py profile.json --timeline 60      # When did hot functions run?
+  analyze_profile.py profile.json -i                 # Interactive shell
   analyze_profile.py before.json --diff after.json   # Compare two profiles
+  analyze_profile.py a1.json a2.json a3.json --diff b1.json b2.json b3.json  # Compare sets of runs
+  analyze_profile.py huge.json --stream              # Bounded-memory loading
+  analyze_profile.py profile.json.gz                 # gzip/zstd read directly
+  analyze_profile.py profile.json --jobs 8           # Analyze threads in parallel
+  analyze_profile.py profile.json --no-cache         # Skip the analysis cache
 """
 
+import cmd
+import gzip
+import hashlib
+import io
 import json
+import os
+import pickle
 import sys
+import time
 import argparse
+import math
 import re
+import shlex
+import sqlite3
+from array import array
+from bisect import bisect_left, bisect_right
 from pathlib import Path
-from collections import defaultdict
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass, field
-from typing import Optional
+from functools import lru_cache
+from itertools import accumulate, islice
+from statistics import NormalDist
+from typing import Callable, Iterable, Iterator, Optional, TextIO
+
+
+EDGE_MASK = (1 << 32) - 1
+
+
+def _count(value: float):
+    """A counter read back from a float array, as int when whole."""
+    return int(value) if value.is_integer() else value
 
 
-@dataclass
 class FunctionStats:
-    """Statistics for a single function."""
+    """Statistics for a single function.
+
+    A view of one row of a FunctionTable: counts and edges are read from
+    the table when accessed, so only the functions being printed ever
+    materialise caller/callee dicts.
+    """
+    __slots__ = ('_table', '_fid')
+
+    def __init__(self, table: "FunctionTable", fid: int):
+        self._table = table
+        self._fid = fid
+
+    @property
+    def name(self) -> str:
+        return self._table.names[self._fid]
+
+    @property
+    def library(self) -> str:
+        return self._table.libraries[self._fid]
+
+    @property
+    def self_samples(self):
+        return _count(self._table.self_samples[self._fid])
+
+    @property
+    def total_samples(self):
+        return _count(self._table.total_samples[self._fid])
+
+    @property
+    def callers(self) -> dict[str, float]:
+        return self._table.callers(self._fid)
+
+    @property
+    def callees(self) -> dict[str, float]:
+        return self._table.callees(self._fid)
+
+    def __repr__(self) -> str:
+        return (f"FunctionStats(name={self.name!r}, self_samples={self.self_samples!r}, "
+                f"total_samples={self.total_samples!r}, library={self.library!r})")
+
+
+MATCH_MODES = ("substring", "exact", "prefix", "regex")
+
+
+class NameIndex:
+    """Function lookup by substring, exact name, prefix or regex.
+
+    Built once per table: names are lowercased and sorted so a prefix query
+    is a bisection, and the results of recent queries are kept so asking
+    again is a dict hit. Substring and prefix queries ignore case; exact
+    and regex queries do not (use (?i) in the pattern). Results are function
+    ids in registration order.
+    """
+
+    CACHE_SIZE = 256
+
+    def __init__(self, names: list[str], ids: dict[str, int]):
+        self._ids = ids
+        self._lowered = [name.lower() for name in names]
+        self._names = names
+        order = sorted(range(len(names)), key=self._lowered.__getitem__)
+        self._order = array('q', order)
+        self._sorted = [self._lowered[fid] for fid in order]
+        self._cache: dict[tuple[str, str], list[int]] = {}
+
+    def find(self, query: str, match: str = "substring") -> list[int]:
+        """Ids of every function matching query. Raises ValueError on a bad regex."""
+        key = (match, query)
+        fids = self._cache.pop(key, None)
+        if fids is None:
+            fids = self._search(query, match)
+            if len(self._cache) >= self.CACHE_SIZE:
+                del self._cache[next(iter(self._cache))]
+        self._cache[key] = fids
+        return fids
+
+    def _search(self, query: str, match: str) -> list[int]:
+        if match == "exact":
+            fid = self._ids.get(query)
+            return [] if fid is None else [fid]
+        if match == "prefix":
+            needle = query.lower()
+            start = bisect_left(self._sorted, needle)
+            end = bisect_left(self._sorted, needle + "\U0010ffff", start)
+            return sorted(self._order[start:end])
+        if match == "regex":
+            try:
+                pattern = re.compile(query)
+            except re.error as e:
+                raise ValueError(f"invalid regex {query!r}: {e}") from None
+            return [fid for fid, name in enumerate(self._names) if pattern.search(name)]
+        needle = query.lower()
+        return [fid for fid, name in enumerate(self._lowered) if needle in name]
+
+
+class FunctionTable:
+    """Per-function statistics stored column-wise under interned ids.
+
+    Function i has a name, a library and self/total counts in flat arrays.
+    Caller -> callee edges are parallel arrays of (caller << 32) | callee
+    keys and weights. The name and edge lookup dicts are only needed while
+    counts are being added; compact() drops them and they are rebuilt on
+    demand, so a finished table costs a few machine words per function and
+    edge. Reads as a mapping of name -> FunctionStats view, in registration
+    order.
+    """
+
+    def __init__(self):
+        self.names: list[str] = []
+        self.libraries: list[str] = []
+        self.self_samples = array('d')
+        self.total_samples = array('d')
+        self.edge_keys = array('q')
+        self.edge_weights = array('d')
+        self._ids: Optional[dict[str, int]] = {}
+        self._edge_index: Optional[dict[int, int]] = {}
+        self._adjacency: Optional[tuple[dict, dict]] = None
+        self._name_index: Optional[NameIndex] = None
+
+    @property
+    def ids(self) -> dict[str, int]:
+        """Name -> function id."""
+        if self._ids is None:
+            self._ids = {name: fid for fid, name in enumerate(self.names)}
+        return self._ids
+
+    def intern(self, name: str, library: str = "unknown") -> int:
+        """Id of a function, registering it on first sight."""
+        ids = self.ids
+        fid = ids.get(name)
+        if fid is None:
+            fid = ids[name] = len(self.names)
+            self.names.append(name)
+            self.libraries.append(library)
+            self.self_samples.append(0)
+            self.total_samples.append(0)
+            self._name_index = None
+        return fid
+
+    def find(self, query: str, match: str = "substring") -> list[int]:
+        """Ids of the functions whose names match query (see NameIndex)."""
+        if self._name_index is None:
+            self._name_index = NameIndex(self.names, self.ids)
+        return self._name_index.find(query, match)
+
+    def add_edge(self, caller: int, callee: int, weight: float):
+        self._add_edge((caller << 32) | callee, weight)
+
+    def _add_edge(self, key: int, weight: float):
+        if self._edge_index is None:
+            self._edge_index = {key: pos for pos, key in enumerate(self.edge_keys)}
+        pos = self._edge_index.get(key)
+        if pos is None:
+            self._edge_index[key] = len(self.edge_keys)
+            self.edge_keys.append(key)
+            self.edge_weights.append(weight)
+        else:
+            self.edge_weights[pos] += weight
+        self._adjacency = None
+
+    def compact(self):
+        """Drop the lookup dicts once no more counts will be added."""
+        self._ids = None
+        self._edge_index = None
+        self._adjacency = None
+        self._name_index = None
+
+    def merge(self, other: "FunctionTable") -> list[int]:
+        """Add another table's counts and edges, matching functions by name.
+
+        Returns the id in this table of each of other's functions.
+        """
+        fids = [self.intern(name, lib) for name, lib in zip(other.names, other.libraries)]
+        self_samples, total_samples = self.self_samples, self.total_samples
+        for fid, own, total in zip(fids, other.self_samples, other.total_samples):
+            self_samples[fid] += own
+            total_samples[fid] += total
+        for key, weight in zip(other.edge_keys, other.edge_weights):
+            self._add_edge((fids[key >> 32] << 32) | fids[key & EDGE_MASK], weight)
+        return fids
+
+    def callers(self, fid: int) -> dict[str, float]:
+        """Caller name -> edge weight, in edge registration order."""
+        keys, weights = self.edge_keys, self.edge_weights
+        return {self.names[keys[pos] >> 32]: _count(weights[pos])
+                for pos in self._edge_lists()[0].get(fid, ())}
+
+    def callees(self, fid: int) -> dict[str, float]:
+        """Callee name -> edge weight, in edge registration order."""
+        keys, weights = self.edge_keys, self.edge_weights
+        return {self.names[keys[pos] & EDGE_MASK]: _count(weights[pos])
+                for pos in self._edge_lists()[1].get(fid, ())}
+
+    def edge_totals(self, fids: Iterable[int], callers: bool = True) -> dict[str, float]:
+        """Callers (or callees) of a group of functions, weights summed by name."""
+        totals: dict[str, float] = {}
+        for fid in fids:
+            for name, weight in (self.callers(fid) if callers else self.callees(fid)).items():
+                totals[name] = totals.get(name, 0) + weight
+        return totals
+
+    def _edge_lists(self) -> tuple[dict, dict]:
+        """Edge positions by callee and by caller, built on first lookup."""
+        if self._adjacency is None:
+            by_callee, by_caller = defaultdict(list), defaultdict(list)
+            for pos, key in enumerate(self.edge_keys):
+                by_callee[key & EDGE_MASK].append(pos)
+                by_caller[key >> 32].append(pos)
+            self._adjacency = (by_callee, by_caller)
+        return self._adjacency
+
+    def view(self, fid: int) -> FunctionStats:
+        return FunctionStats(self, fid)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.ids
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names)
+
+    def __getitem__(self, name: str) -> FunctionStats:
+        return FunctionStats(self, self.ids[name])
+
+    def get(self, name: str, default=None) -> Optional[FunctionStats]:
+        fid = self.ids.get(name)
+        return default if fid is None else FunctionStats(self, fid)
+
+    def keys(self):
+        return self.ids.keys()
+
+    def values(self) -> Iterator[FunctionStats]:
+        return (FunctionStats(self, fid) for fid in range(len(self.names)))
+
+    def items(self) -> Iterator[tuple[str, FunctionStats]]:
+        return ((name, FunctionStats(self, fid)) for fid, name in enumerate(self.names))
+
+    def pack(self) -> tuple:
+        return (self.names, self.libraries, self.self_samples, self.total_samples,
+                self.edge_keys, self.edge_weights)
+
+    @classmethod
+    def unpack(cls, packed: tuple) -> "FunctionTable":
+        table = cls()
+        (table.names, table.libraries, table.self_samples, table.total_samples,
+         table.edge_keys, table.edge_weights) = packed
+        table.compact()  # lookups rebuilt only if needed
+        return table
+
+
+class LocationTable:
+    """Self/total counts per code location within a function.
+
+    A location is a function id, a file and a position: a source line, or
+    an instruction address (with an empty file). Like FunctionTable, rows
+    are columns of arrays and the key index is only kept while counts are
+    being added. Self time is counted at the sampled leaf frame and total
+    time at the outermost frame of each function on the stack, so one
+    function's locations add up to its own self and total.
+    """
+
+    def __init__(self):
+        self.fids = array('q')
+        self.files: list[str] = []
+        self.positions = array('q')
+        self.self_samples = array('d')
+        self.total_samples = array('d')
+        self._index: Optional[dict[tuple[int, str, int], int]] = {}
+
+    def add(self, fid: int, file: str, position: int, own: float = 0, total: float = 0):
+        """Add counts to a location, registering it on first sight."""
+        index = self._index
+        if index is None:
+            index = self._index = {key: i for i, key in enumerate(
+                zip(self.fids, self.files, self.positions))}
+        key = (fid, file, position)
+        i = index.get(key)
+        if i is None:
+            i = index[key] = len(self.files)
+            self.fids.append(fid)
+            self.files.append(file)
+            self.positions.append(position)
+            self.self_samples.append(own)
+            self.total_samples.append(total)
+        else:
+            self.self_samples[i] += own
+            self.total_samples[i] += total
+
+    def compact(self):
+        """Drop the key index once no more counts will be added."""
+        self._index = None
+
+    def merge(self, other: "LocationTable", fids: list[int]):
+        """Add another table's counts; fids maps its function ids to ours."""
+        for fid, file, position, own, total in zip(other.fids, other.files, other.positions,
+                                                   other.self_samples, other.total_samples):
+            self.add(fids[fid], file, position, own, total)
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def pack(self) -> tuple:
+        return (self.fids, self.files, self.positions, self.self_samples, self.total_samples)
+
+    @classmethod
+    def unpack(cls, packed: Optional[tuple]) -> Optional["LocationTable"]:
+        if packed is None:
+            return None
+        table = cls()
+        table.fids, table.files, table.positions, table.self_samples, table.total_samples = packed
+        table.compact()
+        return table
+
+
+class CallTree:
+    """Call tree (prefix tree of call paths) with exact sample counts.
+
+    Nodes are stored column-wise in arrays: node i has a parent node, a
+    function id (an index into names) and its self and inclusive sample
+    counts. Node 0 is a synthetic root above every thread's entry frames.
+    Children are found through a single dict keyed by (parent, function)
+    packed into one int, so a node costs a few machine words rather than a
+    dict of its own. For walks, children are listed in two more arrays
+    built on first use, offsets and children (CSR layout): node n's children
+    are children[offsets[n]:offsets[n + 1]].
+    """
+
+    ROOT = 0
+
+    def __init__(self):
+        self.names: list[str] = []
+        self._name_ids: dict[str, int] = {}
+        self.parent = array('q', [-1])
+        self.func = array('q', [-1])
+        # Doubles so weighted samples work; integral counts stay exact.
+        self.self_samples = array('d', [0])
+        self.total_samples = array('d', [0])
+        self._index: Optional[dict[int, int]] = {}
+        self._children: Optional[tuple[array, array]] = None
+
+    def __len__(self) -> int:
+        return len(self.parent)
+
+    def name_id(self, name: str) -> int:
+        fid = self._name_ids.get(name)
+        if fid is None:
+            fid = self._name_ids[name] = len(self.names)
+            self.names.append(name)
+        return fid
+
+    def child(self, parent: int, name: str) -> int:
+        """Get or create the node for calling name from parent."""
+        return self._child(parent, self.name_id(name))
+
+    def _child(self, parent: int, fid: int) -> int:
+        if self._index is None:
+            self._index = {(self.parent[node] << 32) | self.func[node]: node
+                           for node in range(1, len(self))}
+        key = (parent << 32) | fid
+        node = self._index.get(key)
+        if node is None:
+            node = self._index[key] = len(self.parent)
+            self.parent.append(parent)
+            self.func.append(fid)
+            self.self_samples.append(0)
+            self.total_samples.append(0)
+            self._children = None
+        return node
+
+    def name(self, node: int) -> str:
+        return self.names[self.func[node]]
+
+    def compact(self):
+        """Drop the child index once no more nodes will be added."""
+        self._index = None
+
+    def merge(self, other: "CallTree"):
+        """Add another tree's counts, matching nodes by call path."""
+        fids = [self.name_id(name) for name in other.names]
+        mapped = array('q', [self.ROOT])
+        self_samples, total_samples = self.self_samples, self.total_samples
+        for node, (parent, fid, own, total) in enumerate(
+                zip(other.parent, other.func, other.self_samples, other.total_samples)):
+            if node == self.ROOT:
+                continue
+            mine = self._child(mapped[parent], fids[fid])
+            mapped.append(mine)
+            self_samples[mine] += own
+            total_samples[mine] += total
+        self.total_samples[self.ROOT] += other.total_samples[self.ROOT]
+
+    def children(self, node: int) -> array:
+        """Child nodes, hottest first."""
+        offsets, children = self._child_columns()
+        return children[offsets[node]:offsets[node + 1]]
+
+    def _child_columns(self) -> tuple[array, array]:
+        """(offsets, children) of every node, one pair of arrays per tree.
+
+        All nodes are sorted by total once, then bucketed by parent with a
+        stable counting sort, so each node's run comes out hottest first
+        (ties in creation order) without sorting runs one by one.
+        """
+        if self._children is None:
+            parent, total = self.parent, self.total_samples
+            counts = array('q', bytes(8 * len(self)))
+            for p in islice(parent, 1, None):
+                counts[p] += 1
+            offsets = array('q', accumulate(counts, initial=0))
+            children = array('q', bytes(8 * (len(self) - 1)))
+            fill = offsets[:-1]
+            for child in sorted(range(1, len(self)), key=total.__getitem__, reverse=True):
+                p = parent[child]
+                children[fill[p]] = child
+                fill[p] += 1
+            self._children = (offsets, children)
+        return self._children
+
+    def inverted(self, max_depth: Optional[int] = None) -> "CallTree":
+        """Bottom-up tree: roots are leaf functions, children their callers.
+
+        Each node with self time contributes its samples along its path
+        walked leaf to root, stopping max_depth levels below the leaf, so
+        building costs at most one step per level per sampled path. A root's
+        self count is the function's self time; every node's total is the
+        samples whose stack ends with that caller chain.
+        """
+        inv = CallTree()
+        inv.names = list(self.names)
+        inv._name_ids = dict(self._name_ids)
+        inv.total_samples[self.ROOT] = self.total_samples[self.ROOT]
+        parent, func = self.parent, self.func
+        for node, weight in enumerate(self.self_samples):
+            if not weight or node == self.ROOT:
+                continue
+            leaf = inv._child(self.ROOT, func[node])
+            inv.self_samples[leaf] += weight
+            inv.total_samples[leaf] += weight
+            inv_node, caller, depth = leaf, parent[node], 1
+            while caller != self.ROOT and (max_depth is None or depth <= max_depth):
+                inv_node = inv._child(inv_node, func[caller])
+                inv.total_samples[inv_node] += weight
+                caller = parent[caller]
+                depth += 1
+        return inv
+
+    def pack(self) -> tuple:
+        return (self.names, self.parent, self.func, self.self_samples, self.total_samples)
+
+    @classmethod
+    def unpack(cls, packed: Optional[tuple]) -> Optional["CallTree"]:
+        if packed is None:
+            return None
+        tree = cls()
+        tree.names, tree.parent, tree.func, tree.self_samples, tree.total_samples = packed
+        tree._name_ids = {name: fid for fid, name in enumerate(tree.names)}
+        tree._index = None  # rebuilt only if nodes are added
+        return tree
+
+
+@dataclass
+class ThreadResult:
+    """Aggregated statistics for one thread, merged into the profile totals."""
     name: str
-    self_samples: int = 0
     total_samples: int = 0
-    callers: dict = field(default_factory=lambda: defaultdict(int))
-    callees: dict = field(default_factory=lambda: defaultdict(int))
-    library: str = "unknown"
+    # Sum of squared sample weights, for the effective sample size; equal
+    # to total_samples when every sample counts 1.
+    weight_squares: float = 0
+    # Weightings applied to the counted samples; see applied_weighting().
+    weighting: tuple[str, ...] = ()
+    functions: FunctionTable = field(default_factory=FunctionTable)
+    # Only built when the analyzer runs with call_trees=True.
+    call_tree: Optional[CallTree] = None
+    # (time_ms, leaf call_tree function id, weight) arrays, one entry per
+    # sample; only collected when the analyzer runs with timeline=True.
+    series: Optional[tuple[array, array, array]] = None
+    # Per source line and per instruction address counts; only collected
+    # when the analyzer runs with locations=True.
+    lines: Optional[LocationTable] = None
+    addresses: Optional[LocationTable] = None
+
+    def merge(self, other: "ThreadResult"):
+        """Add a result for the same thread from another profile.
+
+        Sample series are dropped: times from different runs do not share
+        a clock.
+        """
+        self.total_samples += other.total_samples
+        self.weight_squares += other.weight_squares
+        self.weighting += tuple(w for w in other.weighting if w not in self.weighting)
+        fids = self.functions.merge(other.functions)
+        if self.lines is not None and other.lines is not None:
+            self.lines.merge(other.lines, fids)
+            self.addresses.merge(other.addresses, fids)
+        if self.call_tree is not None and other.call_tree is not None:
+            self.call_tree.merge(other.call_tree)
+        self.series = None
+
+
+# Pools of numbered threads ("rayon-worker-12", "tokio-runtime-worker #3")
+# grouped under their name without the number.
+DEFAULT_THREAD_GROUPS = (r'^(.*?)[\s#_-]*\d+$',)
 
 
+@dataclass
+class ThreadGroup:
+    """Per-thread results merged into one pool of threads."""
+    name: str
+    threads: list[str] = field(default_factory=list)
+    total_samples: float = 0
+    functions: FunctionTable = field(default_factory=FunctionTable)
+
+    def add(self, result: ThreadResult):
+        self.threads.append(result.name)
+        self.total_samples += result.total_samples
+        self.functions.merge(result.functions)
+
+
+def compile_thread_groups(patterns: Iterable[str]) -> list[re.Pattern]:
+    """Compile --group-threads patterns, reporting a bad one as ValueError."""
+    compiled = []
+    for pattern in patterns:
+        try:
+            compiled.append(re.compile(pattern))
+        except re.error as e:
+            raise ValueError(f"invalid regex {pattern!r}: {e}") from None
+    return compiled
+
+
+def thread_group_name(thread_name: str, patterns: list[re.Pattern]) -> str:
+    """Group of a thread: the first pattern it matches names it, by the
+    pattern's capture groups when it has any. When none of them captured
+    text, the matched text (or the pattern itself, for an empty match)
+    names the group instead. Unmatched threads are their own group."""
+    for pattern in patterns:
+        m = pattern.search(thread_name)
+        if m:
+            captured = "".join(g for g in m.groups() if g)
+            if not pattern.groups:
+                return pattern.pattern
+            return captured or m.group(0) or pattern.pattern
+    return thread_name
+
+
+class DemangleError(ValueError):
+    """A symbol that does not follow the mangling scheme it claims."""
+
+
+# Legacy Rust symbols escape punctuation as $XX$ inside each path component.
+LEGACY_ESCAPES = {
+    'SP': '@', 'BP': '*', 'RF': '&', 'LT': '<', 'GT': '>', 'LP': '(', 'RP': ')', 'C': ',',
+}
+LEGACY_HASH = re.compile(r'h[0-9a-f]{16}')
+LEGACY_ESCAPE = re.compile(r'\$([A-Z]+|u[0-9a-f]+)\$')
+# Hash suffix and escapes left in names that were only partly demangled.
+DEMANGLED_HASH = re.compile(r'::h[0-9a-f]{16}$')
+
+
+def _legacy_unescape(match: re.Match) -> str:
+    code = match.group(1)
+    if code[0] == 'u' and code != 'u':
+        try:
+            return chr(int(code[1:], 16))
+        except (ValueError, OverflowError):
+            return match.group(0)
+    return LEGACY_ESCAPES.get(code, match.group(0))
+
+
+def demangle_legacy(symbol: str) -> str:
+    """Demangle a legacy Rust symbol (_ZN...17h<hash>E), dropping the hash."""
+    start = symbol.find('ZN')
+    if start < 0 or symbol[:start].strip('_'):
+        raise DemangleError("not a legacy symbol")
+    pos, end = start + 2, len(symbol)
+    parts = []
+    while pos < end and symbol[pos] != 'E':
+        digits = pos
+        while pos < end and symbol[pos].isdigit():
+            pos += 1
+        if pos == digits:
+            raise DemangleError("expected a length")
+        length = int(symbol[digits:pos])
+        part = symbol[pos:pos + length]
+        if len(part) != length:
+            raise DemangleError("truncated component")
+        pos += length
+        parts.append(part)
+    if pos >= end or not parts:
+        raise DemangleError("unterminated path")
+    if len(parts) > 1 and LEGACY_HASH.fullmatch(parts[-1]):
+        parts.pop()
+
+    out = []
+    for part in parts:
+        if part.startswith('_$'):
+            part = part[1:]
+        part = LEGACY_ESCAPE.sub(_legacy_unescape, part).replace('..', '::')
+        out.append(part)
+    return '::'.join(out)
+
+
+V0_BASIC_TYPES = {
+    'a': 'i8', 'b': 'bool', 'c': 'char', 'd': 'f64', 'e': 'str', 'f': 'f32', 'h': 'u8',
+    'i': 'isize', 'j': 'usize', 'l': 'i32', 'm': 'u32', 'n': 'i128', 'o': 'u128', 's': 'i16',
+    't': 'u16', 'u': '()', 'v': '...', 'x': 'i64', 'y': 'u64', 'z': '!', 'p': '_',
+}
+V0_SIGNED = frozenset('aslxni')
+V0_UNSIGNED = frozenset('htmyoj')
+
+
+class _V0Demangler:
+    """Recursive-descent printer for Rust v0 symbols (RFC 2603).
+
+    Output follows rustc-demangle's alternate form: crate disambiguators
+    and the instantiating crate are omitted.
+    """
+
+    MAX_DEPTH = 300
+
+    def __init__(self, symbol: str, start: int):
+        self.s = symbol
+        self.pos = start
+        self.base = start  # backrefs are offsets from just after "_R"
+        self.out: list[str] = []
+        self.depth = 0
+        self.bound_lifetimes = 0
+
+    # -- lexing --------------------------------------------------------
+
+    def peek(self) -> str:
+        return self.s[self.pos] if self.pos < len(self.s) else ''
+
+    def next(self) -> str:
+        c = self.peek()
+        if not c:
+            raise DemangleError("unexpected end of symbol")
+        self.pos += 1
+        return c
+
+    def eat(self, c: str) -> bool:
+        if self.peek() == c:
+            self.pos += 1
+            return True
+        return False
+
+    def base62(self) -> int:
+        if self.eat('_'):
+            return 0
+        value = 0
+        while not self.eat('_'):
+            c = self.next()
+            if c.isdigit():
+                digit = ord(c) - 48
+            elif 'a' <= c <= 'z':
+                digit = ord(c) - 87
+            elif 'A' <= c <= 'Z':
+                digit = ord(c) - 29
+            else:
+                raise DemangleError(f"bad base-62 digit {c!r}")
+            value = value * 62 + digit
+        return value + 1
+
+    def opt_base62(self, tag: str) -> int:
+        return self.base62() + 1 if self.eat(tag) else 0
+
+    def decimal(self) -> int:
+        start = self.pos
+        if self.eat('0'):
+            return 0
+        while self.peek().isdigit():
+            self.pos += 1
+        if self.pos == start:
+            raise DemangleError("expected a decimal number")
+        return int(self.s[start:self.pos])
+
+    def ident(self) -> str:
+        punycode = self.eat('u')
+        length = self.decimal()
+        self.eat('_')
+        text = self.s[self.pos:self.pos + length]
+        if len(text) != length:
+            raise DemangleError("truncated identifier")
+        self.pos += length
+        if punycode:
+            # Punycode with '-' replaced by '_'; the last '_' is the delimiter.
+            head, sep, tail = text.rpartition('_')
+            encoded = f"{head}-{tail}" if sep else text
+            try:
+                text = encoded.encode('ascii').decode('punycode')
+            except (UnicodeError, ValueError):
+                raise DemangleError("bad punycode") from None
+        return text
+
+    # -- printing ------------------------------------------------------
+
+    def emit(self, text: str):
+        self.out.append(text)
+
+    def enter(self):
+        self.depth += 1
+        if self.depth > self.MAX_DEPTH:
+            raise DemangleError("symbol nests too deeply")
+
+    def backref(self, printer: Callable[[], object]):
+        target = self.base + self.base62()
+        if target >= self.pos - 1:
+            raise DemangleError("forward backref")
+        saved = self.pos
+        self.pos = target
+        self.enter()
+        result = printer()
+        self.depth -= 1
+        self.pos = saved
+        return result
+
+    def lifetime(self, index: int):
+        if index == 0:
+            self.emit("'_")
+            return
+        depth = self.bound_lifetimes - index
+        if depth < 0:
+            raise DemangleError("lifetime index out of range")
+        self.emit("'" + chr(ord('a') + depth) if depth < 26 else f"'_{depth}")
+
+    def in_binder(self, body: Callable[[], None]):
+        bound = self.opt_base62('G')
+        if bound:
+            self.emit("for<")
+            for i in range(bound):
+                if i:
+                    self.emit(", ")
+                self.bound_lifetimes += 1
+                self.lifetime(1)
+            self.emit("> ")
+        body()
+        self.bound_lifetimes -= bound
+
+    def path(self, in_value: bool):
+        self.enter()
+        tag = self.next()
+        if tag == 'C':
+            self.opt_base62('s')
+            self.emit(self.ident())
+        elif tag == 'N':
+            ns = self.next()
+            self.path(in_value)
+            dis = self.opt_base62('s')
+            name = self.ident()
+            if 'A' <= ns <= 'Z':
+                self.emit("::{" + {'C': "closure", 'S': "shim"}.get(ns, ns))
+                if name:
+                    self.emit(":" + name)
+                self.emit(f"#{dis}}}")
+            elif name:
+                self.emit("::" + name)
+        elif tag in 'MXY':
+            if tag != 'Y':
+                self.opt_base62('s')
+                self.skip(self.path, False)
+            self.emit("<")
+            self.type()
+            if tag != 'M':
+                self.emit(" as ")
+                self.path(False)
+            self.emit(">")
+        elif tag == 'I':
+            self.path(in_value)
+            if in_value:
+                self.emit("::")
+            self.emit("<")
+            self.generic_args()
+            self.emit(">")
+        elif tag == 'B':
+            self.backref(lambda: self.path(in_value))
+        else:
+            raise DemangleError(f"bad path tag {tag!r}")
+        self.depth -= 1
+
+    def skip(self, printer: Callable, *args):
+        """Parse without printing (impl paths are not shown)."""
+        mark = len(self.out)
+        printer(*args)
+        del self.out[mark:]
+
+    def generic_args(self):
+        first = True
+        while not self.eat('E'):
+            if not first:
+                self.emit(", ")
+            first = False
+            if self.eat('L'):
+                self.lifetime(self.base62())
+            elif self.eat('K'):
+                self.const()
+            else:
+                self.type()
+
+    def type(self):
+        self.enter()
+        tag = self.next()
+        if tag in V0_BASIC_TYPES:
+            self.emit(V0_BASIC_TYPES[tag])
+        elif tag in 'RQ':
+            self.emit("&")
+            if self.eat('L'):
+                index = self.base62()
+                if index:
+                    self.lifetime(index)
+                    self.emit(" ")
+            if tag == 'Q':
+                self.emit("mut ")
+            self.type()
+        elif tag == 'P':
+            self.emit("*const ")
+            self.type()
+        elif tag == 'O':
+            self.emit("*mut ")
+            self.type()
+        elif tag == 'A':
+            self.emit("[")
+            self.type()
+            self.emit("; ")
+            self.const()
+            self.emit("]")
+        elif tag == 'S':
+            self.emit("[")
+            self.type()
+            self.emit("]")
+        elif tag == 'T':
+            self.emit("(")
+            count = 0
+            while not self.eat('E'):
+                if count:
+                    self.emit(", ")
+                self.type()
+                count += 1
+            self.emit(",)" if count == 1 else ")")
+        elif tag == 'F':
+            self.in_binder(self.fn_sig)
+        elif tag == 'D':
+            self.emit("dyn ")
+            self.in_binder(self.dyn_bounds)
+            if not self.eat('L'):
+                raise DemangleError("dyn type without a lifetime")
+            index = self.base62()
+            if index:
+                self.emit(" + ")
+                self.lifetime(index)
+        elif tag == 'B':
+            self.backref(self.type)
+        else:
+            self.pos -= 1
+            self.path(False)
+        self.depth -= 1
+
+    def fn_sig(self):
+        if self.eat('U'):
+            self.emit("unsafe ")
+        if self.eat('K'):
+            abi = "C" if self.eat('C') else self.ident().replace('_', '-')
+            self.emit(f'extern "{abi}" ')
+        self.emit("fn(")
+        first = True
+        while not self.eat('E'):
+            if not first:
+                self.emit(", ")
+            first = False
+            self.type()
+        self.emit(")")
+        if self.eat('u'):
+            return
+        self.emit(" -> ")
+        self.type()
+
+    def dyn_bounds(self):
+        first = True
+        while not self.eat('E'):
+            if not first:
+                self.emit(" + ")
+            first = False
+            self.dyn_trait()
+
+    def dyn_trait(self):
+        open_generics = self.path_open_generics()
+        while self.eat('p'):
+            self.emit(", " if open_generics else "<")
+            open_generics = True
+            self.emit(self.ident() + " = ")
+            self.type()
+        if open_generics:
+            self.emit(">")
+
+    def path_open_generics(self) -> bool:
+        """Print a trait path, leaving its generic list open for bindings."""
+        if self.eat('B'):
+            return self.backref(self.path_open_generics)
+        if self.eat('I'):
+            self.path(False)
+            self.emit("<")
+            first = True
+            while not self.eat('E'):
+                if not first:
+                    self.emit(", ")
+                first = False
+                if self.eat('L'):
+                    self.lifetime(self.base62())
+                elif self.eat('K'):
+                    self.const()
+                else:
+                    self.type()
+            return True
+        self.path(False)
+        return False
+
+    def hex(self) -> str:
+        start = self.pos
+        while self.peek() in '0123456789abcdef' and self.peek():
+            self.pos += 1
+        digits = self.s[start:self.pos]
+        if not self.eat('_'):
+            raise DemangleError("unterminated constant")
+        return digits
+
+    def const(self):
+        if self.eat('B'):
+            self.backref(self.const)
+            return
+        tag = self.next()
+        if tag == 'p':
+            self.emit("_")
+        elif tag in V0_UNSIGNED or tag in V0_SIGNED:
+            negative = tag in V0_SIGNED and self.eat('n')
+            value = int(self.hex() or '0', 16)
+            self.emit(f"-{value}" if negative else str(value))
+        elif tag == 'b':
+            digits = self.hex()
+            if digits not in ('0', '1'):
+                raise DemangleError("bad bool constant")
+            self.emit("true" if digits == '1' else "false")
+        elif tag == 'c':
+            value = int(self.hex() or '0', 16)
+            try:
+                self.emit(repr(chr(value)))
+            except (ValueError, OverflowError):
+                raise DemangleError("bad char constant") from None
+        elif tag == 'e':
+            digits = self.hex()
+            try:
+                text = bytes.fromhex(digits).decode('utf-8')
+            except ValueError:
+                raise DemangleError("bad str constant") from None
+            self.emit(json.dumps(text, ensure_ascii=False))
+        else:
+            raise DemangleError(f"unsupported constant {tag!r}")
+
+    def symbol(self) -> str:
+        if self.peek().isdigit():
+            self.decimal()  # encoding version
+        self.path(True)
+        # An instantiating crate and any vendor suffix are not shown.
+        return ''.join(self.out)
+
+
+def demangle_v0(symbol: str) -> str:
+    """Demangle a Rust v0 symbol (_R...), without crate disambiguators."""
+    start = symbol.find('R')
+    if start < 0 or symbol[:start].strip('_'):
+        raise DemangleError("not a v0 symbol")
+    return _V0Demangler(symbol, start + 1).symbol()
+
+
+_cxa_demangle = None
+
+
+def demangle_cpp(symbol: str) -> Optional[str]:
+    """Demangle a C++ Itanium symbol with the C++ runtime's __cxa_demangle.
+
+    Returns None when the runtime cannot be loaded or the name is invalid;
+    the C++ runtime is optional, so C++ frames are then shown raw.
+    """
+    global _cxa_demangle
+    if _cxa_demangle is None:
+        _cxa_demangle = _load_cxa_demangle() or False
+    if not _cxa_demangle:
+        return None
+    return _cxa_demangle(symbol)
+
+
+def _load_cxa_demangle() -> Optional[Callable[[str], Optional[str]]]:
+    try:
+        import ctypes
+        import ctypes.util
+    except ImportError:
+        return None
+    for name in ('c++abi', 'stdc++'):
+        path = ctypes.util.find_library(name)
+        if not path:
+            continue
+        try:
+            runtime = ctypes.CDLL(path)
+            libc = ctypes.CDLL(ctypes.util.find_library('c'))
+            cxa = runtime.__cxa_demangle
+        except (OSError, AttributeError, TypeError):
+            continue
+        cxa.restype = ctypes.c_void_p
+        cxa.argtypes = [ctypes.c_char_p, ctypes.c_void_p, ctypes.c_void_p,
+                        ctypes.POINTER(ctypes.c_int)]
+        libc.free.argtypes = [ctypes.c_void_p]
+
+        def demangle(symbol: str) -> Optional[str]:
+            status = ctypes.c_int()
+            result = cxa(symbol.encode(), None, None, ctypes.byref(status))
+            if not result:
+                return None
+            try:
+                return ctypes.string_at(result).decode('utf-8', 'replace') if status.value == 0 else None
+            finally:
+                libc.free(result)
+        return demangle
+    return None
+
+
+@lru_cache(maxsize=65536)
 def demangle_rust(name: str) -> str:
-    """Simplify Rust mangled names for readability."""
+    """Readable name for a frame symbol, memoized by raw symbol.
+
+    Rust legacy (_ZN...h<hash>E) and v0 (_R...) symbols are fully
+    demangled, other Itanium (_Z) symbols go through the C++ runtime when
+    it is available, and names the profiler already demangled only lose
+    their ::h<hash> suffix and leftover $..$ escapes.
+    """
     if not name:
         return "unknown"
 
-    # Remove hash suffixes like ::h1234abcd
-    name = re.sub(r'::h[0-9a-f]{16}$', '', name)
-
-    # Simplify common patterns
-    name = name.replace('$LT$', '<').replace('$GT$', '>')
-    name = name.replace('$u20$', ' ').replace('$u27$', "'")
-    name = name.replace('$RF$', '&').replace('$BP$', '*')
-    name = name.replace('$C$', ',').replace('$SP$', '@')
+    bare = name.lstrip('_')
+    lead = len(name) - len(bare)
+    try:
+        if bare.startswith('ZN') and lead and LEGACY_HASH.search(name):
+            name = demangle_legacy(name)
+        elif bare.startswith('R') and 1 <= lead <= 2 and len(bare) > 1 and bare[1] in 'CNMXYIB0123456789':
+            name = demangle_v0(name)
+        elif bare.startswith('Z') and 1 <= lead <= 2:
+            name = demangle_cpp(name[lead - 1:]) or name
+        else:
+            name = DEMANGLED_HASH.sub('', name)
+            if '$' in name:
+                # Legacy escapes left in: '..' is that scheme's '::' as well.
+                name = LEGACY_ESCAPE.sub(_legacy_unescape, name).replace('..', '::')
+    except DemangleError:
+        pass
 
-    # Shorten very long generic parameters
-    if len(name) > 120:
-        # Truncate long generic params but keep function name visible
-        if '<' in name:
-            base = name.split('<')[0]
-            name = f"{base}<...>"
+    # Shorten very long generic parameters but keep the function name visible
+    if len(name) > 120 and '<' in name:
+        name = elide_generics(name)
 
     return name
 
 
+def elide_generics(name: str) -> str:
+    """Replace generic argument lists with <...>.
+
+    A leading qualified path like <T as Trait> is kept, with its own
+    generics elided, so trait method names stay readable.
+    """
+    out = []
+    depth = 0
+    qualified = name.startswith('<')
+    for i, c in enumerate(name):
+        limit = 2 if qualified else 1
+        if c == '<':
+            depth += 1
+            if depth == limit:
+                out.append('<...>')
+            elif depth < limit:
+                out.append(c)
+        elif c == '>' and i and name[i - 1] != '-':
+            if depth < limit:
+                out.append(c)
+            depth -= 1
+            if qualified and depth == 0:
+                qualified = False
+        elif depth < limit:
+            out.append(c)
+    return ''.join(out)
+
+
+def _find_top_level(text: str, sub: str) -> int:
+    """Index of the first sub in text outside any brackets, or -1."""
+    depth = 0
+    for i, c in enumerate(text):
+        if c == '>' and i and text[i - 1] == '-':
+            continue  # fn() -> T
+        if depth == 0 and text.startswith(sub, i):
+            return i
+        if c in '<([':
+            depth += 1
+        elif c in '>)]':
+            depth = max(depth - 1, 0)
+    return -1
+
+
+def split_path(path: str) -> list[str]:
+    """Split a demangled path on the '::' separators outside brackets."""
+    segments = []
+    at = _find_top_level(path, '::')
+    while at >= 0:
+        segments.append(path[:at])
+        path = path[at + 2:]
+        at = _find_top_level(path, '::')
+    segments.append(path)
+    return segments
+
+
+SELF_TYPE_PREFIXES = ('&mut ', '&', '*const ', '*mut ', 'dyn ')
+
+
+def namespace_path(name: str, library: str) -> list[str]:
+    """Crate, modules and function of a demangled name, outermost first.
+
+    A method of <T as Trait> or <T> is filed under T's path. Generic
+    arguments are dropped from all but the last segment, so the impls of a
+    type for different parameters share one module, and a C++ argument list
+    is dropped. Names without a path (C symbols, raw addresses) are filed
+    under their library in brackets.
+    """
+    head: list[str] = []
+    rest = name
+    if name.startswith('<'):
+        end = _find_top_level(name[1:], '>')
+        if end >= 0:
+            self_type = name[1:end + 1]
+            as_at = _find_top_level(self_type, ' as ')
+            if as_at >= 0:
+                self_type = self_type[:as_at]
+            for prefix in SELF_TYPE_PREFIXES:
+                if self_type.startswith(prefix):
+                    self_type = self_type[len(prefix):]
+            head = split_path(self_type)
+            rest = name[end + 2:].removeprefix('::')
+    args_at = _find_top_level(rest, '(')
+    if args_at > 0:
+        rest = rest[:args_at]
+    segments = [segment for segment in head + split_path(rest) if segment]
+    if len(segments) < 2:
+        return [f"[{library}]", name]
+    return [segment.split('<', 1)[0] or segment for segment in segments[:-1]] + [segments[-1]]
+
+
 def shorten_name(name: str, max_len: int = 80) -> str:
     """Shorten function name for display."""
     if len(name) <= max_len:
@@ -76,41 +1244,456 @@ def shorten_name(name: str, max_len: int = 80) -> str:
     return name[:max_len-3] + "..."
 
 
-class ProfileAnalyzer:
-    """Analyzes samply/Firefox Profiler JSON files."""
+def shorten_path(path: str, max_len: int = 40) -> str:
+    """Shorten a file path for display, keeping its end."""
+    if len(path) <= max_len:
+        return path
+    return "..." + path[-(max_len-3):]
+
+
+# Thread tables and the columns of each that the analyzer reads. The
+# streaming loader keeps only these and skips everything else unparsed.
+# Number columns are decoded into arrays, with null read as the value given
+# here: -1 for an index (which the analyzer treats like None) and 0 for a
+# time or weight. Columns mapped to None are decoded as they are.
+THREAD_COLUMNS = {
+    'stackTable': {'frame': -1, 'prefix': -1},
+    'frameTable': {'func': -1, 'nativeSymbol': -1, 'address': -1, 'line': -1, 'inlineDepth': 0},
+    'funcTable': {'name': -1, 'fileName': -1},
+    'nativeSymbols': {'name': -1, 'libIndex': -1},
+    'samples': {'stack': -1, 'time': 0, 'timeDeltas': 0, 'weight': 0, 'weightType': None,
+                'threadCPUDelta': 0},
+}
+THREAD_FIELDS = ('name', 'stringArray')
+PROFILE_FIELDS = ('meta', 'libs')
+
+
+class JsonStream:
+    """Minimal pull parser for walking a large JSON document in pieces.
+
+    Values that are kept go through json's C decoder one at a time; values
+    that are skipped are scanned for brackets and strings without ever being
+    turned into Python objects.
+    """
+
+    CHUNK_SIZE = 1 << 20
+    _WHITESPACE = re.compile(r'[ \t\n\r]*')
+    _STRUCTURE = re.compile(r'[\[\]{}"]')
+    _STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+
+    def __init__(self, f: TextIO):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        """Read more input, at least doubling what is buffered past pos."""
+        if self.eof:
+            return False
+        chunk = self.f.read(max(self.CHUNK_SIZE, len(self.buf) - self.pos))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character ('' at EOF)."""
+        while True:
+            self.pos = self._WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} at offset {self.pos}, found {found!r}")
+        self.pos += 1
+
+    def read_value(self):
+        """Decode the next complete value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number running into the end of the buffer may be truncated.
+            if end == len(self.buf) and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return value
 
-    def __init__(self, data: dict):
-        self.data = data
-        self.libs_by_index, self.libs_by_addr = self._load_libs()
-        self.threads = data.get('threads', [])
-        self.functions: dict[str, FunctionStats] = {}
-        self.total_samples = 0
+    def skip_value(self):
+        """Advance past the next value without building it."""
+        if self.peek() not in '[{':
+            self.read_value()
+            return
+        depth = 0
+        while True:
+            m = self._STRUCTURE.search(self.buf, self.pos)
+            if m is None:
+                self.pos = len(self.buf)
+                if not self._fill():
+                    raise ValueError("Unexpected end of JSON input")
+                continue
+            if m.group() == '"':
+                string = self._STRING.match(self.buf, m.start())
+                if string is None:
+                    self.pos = m.start()
+                    if not self._fill():
+                        raise ValueError("Unterminated string in JSON input")
+                    continue
+                self.pos = string.end()
+                continue
+            self.pos = m.end()
+            depth += 1 if m.group() in '[{' else -1
+            if depth == 0:
+                return
 
-    def _load_libs(self) -> tuple[list[tuple], list[tuple]]:
-        """Load library address ranges and preserve original order for libIndex."""
-        libs = self.data.get('libs', [])
-        lib_ranges = []
-        for lib in libs:
-            name = lib.get('name') or lib.get('debugName') or Path(lib.get('path', '')).name or 'unknown'
-            start = lib.get('start', 0)
-            end = lib.get('end')
-            lib_ranges.append((start, end, name))
-        lib_ranges_by_addr = sorted(lib_ranges, key=lambda x: x[0])
-        return lib_ranges, lib_ranges_by_addr
+    def iter_object(self) -> Iterator[str]:
+        """Yield each key of an object; the caller must consume its value."""
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.read_value()
+            self.expect(':')
+            yield key
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect('}')
+            return
 
-    def _addr_to_lib(self, addr: int) -> str:
-        """Map address to library name."""
-        for start, end, name in self.libs_by_addr:
-            if start <= addr:
-                if end is None or addr < end:
-                    return name
+    def iter_array(self) -> Iterator[None]:
+        """Yield once per array element; the caller must consume it."""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect(']')
+            return
+
+    def read_numbers(self, null: int = -1):
+        """Decode an array of numbers into array('q'), or array('d') once a
+        number is not an integer, without building a list of boxed numbers.
+
+        The buffered text up to the last comma is converted in one go, so a
+        column costs 8 bytes per element plus one chunk of text. null is read
+        as the given value. Anything else than an array of numbers is decoded
+        as it is.
+        """
+        if self.peek() != '[':
+            return self.read_value()
+        self.pos += 1
+        column = array('q')
+        convert = int
+        while True:
+            end = self.buf.find(']', self.pos)
+            cut = end if end >= 0 else self.buf.rfind(',', self.pos)
+            if cut < 0:
+                if not self._fill():
+                    raise ValueError("Unexpected end of JSON input")
+                continue
+            text = self.buf[self.pos:cut]
+            self.pos = cut + 1
+            if text.strip():
+                items = text.split(',')
+                if 'n' in text:
+                    items = [null if item.strip() == 'null' else item for item in items]
+                try:
+                    column.extend(array(column.typecode, map(convert, items)))
+                except (ValueError, OverflowError):
+                    if convert is float:
+                        raise ValueError(f"Expected numbers before offset {self.pos}") from None
+                    column, convert = array('d', column), float
+                    column.extend(array('d', map(convert, items)))
+            if end >= 0:
+                return column
+
+    def read_object(self, keep: Iterable[str]) -> dict:
+        """Read an object, keeping only the given keys.
+
+        With keep a dict, keys mapped to a null value are number columns,
+        decoded by read_numbers(null).
+        """
+        numbers = keep if isinstance(keep, dict) else {}
+        keep = set(keep)
+        result = {}
+        for key in self.iter_object():
+            if key not in keep:
+                self.skip_value()
+            elif numbers.get(key) is not None:
+                result[key] = self.read_numbers(numbers[key])
+            else:
+                result[key] = self.read_value()
+        return result
+
+
+def _read_thread(stream: JsonStream) -> dict:
+    """Read one thread object, pruned to the tables the analyzer uses."""
+    thread = {}
+    for key in stream.iter_object():
+        if key in THREAD_COLUMNS:
+            thread[key] = stream.read_object(THREAD_COLUMNS[key])
+        elif key in THREAD_FIELDS:
+            thread[key] = stream.read_value()
+        else:
+            stream.skip_value()
+    return thread
+
+
+def stream_profile(f: TextIO) -> dict:
+    """Load a profile incrementally.
+
+    Returns a dict with 'meta' and 'libs' parsed and 'threads' as an iterator
+    that parses one pruned thread at a time, so only the thread currently
+    being analyzed is in memory. If 'threads' appears before 'libs' in the
+    file, the pruned threads are buffered into a list instead.
+    """
+    stream = JsonStream(f)
+    data: dict = {}
+    keys = stream.iter_object()
+    for key in keys:
+        if key == 'threads':
+            threads = (_read_thread(stream) for _ in stream.iter_array())
+            if 'libs' in data:
+                data['threads'] = threads
+                return data
+            data['threads'] = list(threads)
+        elif key in PROFILE_FIELDS:
+            data[key] = stream.read_value()
+        else:
+            stream.skip_value()
+    return data
+
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+
+def _open_zstd(path: Path) -> TextIO:
+    """Open a zstd file as text via compression.zstd (3.14+) or zstandard."""
+    try:
+        from compression import zstd
+    except ImportError:
+        pass
+    else:
+        return zstd.open(path, 'rt', encoding='utf-8')
+
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError(f"{path} is zstd-compressed; install 'zstandard' "
+                           f"(pip install zstandard) or use Python 3.14+") from None
+    raw = open(path, 'rb')
+    reader = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+    return io.TextIOWrapper(reader, encoding='utf-8')
+
+
+def open_profile(path: Path) -> TextIO:
+    """Open a profile as text, decompressing gzip or zstd on the fly.
+
+    The format is sniffed from the magic bytes rather than the extension,
+    and decompressed data is streamed straight into the loader without a
+    temporary file.
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if magic == ZSTD_MAGIC:
+        return _open_zstd(path)
+    return open(path, encoding='utf-8')
+
+
+def peak_rss() -> Optional[int]:
+    """Peak resident set size of this process in bytes, if available."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS but kilobytes on Linux.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+WEIGHT_MODES = ("auto", "samples", "weight", "cpu")
+
+
+def weight_column(samples: dict, mode: str = "auto") -> Optional[list]:
+    """The per-sample weight column for a --weight mode, or None for 1 each.
+
+    Modes:
+      samples - every sample counts 1
+      weight  - samples.weight (samply's weighted or off-CPU samples)
+      cpu     - samples.threadCPUDelta, i.e. CPU time since the last sample
+      auto    - samples.weight when present, otherwise 1 per sample
+    When the requested column is missing each sample counts 1.
+    """
+    if mode in ("auto", "weight"):
+        return samples.get('weight') or None
+    if mode == "cpu":
+        return samples.get('threadCPUDelta') or None
+    return None
+
+
+def applied_weighting(samples: dict, mode: str = "auto") -> str:
+    """The weighting a --weight mode actually gives a samples table:
+    "weight", "cpu", or "samples" when its column is missing."""
+    if weight_column(samples, mode) is None:
+        return "samples"
+    return "cpu" if mode == "cpu" else "weight"
+
+
+def sample_weights(samples: dict, mode: str = "auto") -> dict:
+    """Total weight per stack index for one thread's samples table.
+
+    This is a bulk pass over the sample columns with no per-frame work;
+    unweighted profiles take the Counter fast path.
+    """
+    stacks = samples.get('stack', [])
+    weights = weight_column(samples, mode)
+    if weights is None:
+        counts = Counter(stacks)
+    else:
+        counts = defaultdict(int)
+        for stack_idx, weight in zip(stacks, weights):
+            if weight:
+                counts[stack_idx] += weight
+    # Samples without a stack: null, or -1 in a streamed number column.
+    counts.pop(None, None)
+    counts.pop(-1, None)
+    return counts
+
+
+def sample_times(samples: dict) -> list:
+    """Absolute sample timestamps in ms.
+
+    The newer format only has samples.timeDeltas. Their running sum is
+    computed once and stored back on the table as samples.time, with the
+    deltas dropped, so later slices and timelines of the same thread reuse
+    that column.
+    """
+    times = samples.get('time')
+    if times is None:
+        deltas = samples.pop('timeDeltas', None)
+        if deltas is None:
+            return []
+        times = samples['time'] = array('d', accumulate(deltas))
+    return times
+
+
+def slice_samples(samples: dict, start: Optional[float], end: Optional[float]) -> dict:
+    """Restrict a samples table to start <= time < end (ms; None is open).
+
+    Sample times are sorted, so once the thread's absolute times exist the
+    bounds are found by binary search and only the k samples inside the
+    window are copied: O(log n + k). The slice carries absolute times, never
+    deltas.
+    """
+    times = sample_times(samples)
+    lo = bisect_left(times, start) if start is not None else 0
+    hi = bisect_left(times, end) if end is not None else len(times)
+    return {key: column[lo:hi] if isinstance(column, (list, array)) else column
+            for key, column in samples.items()}
+
+
+def format_window(time_range: tuple) -> str:
+    """Render a (start_ms, end_ms) window in seconds."""
+    start, end = time_range
+    return (f"{'start' if start is None else f'{start / 1000:.3f}s'} - "
+            f"{'end' if end is None else f'{end / 1000:.3f}s'}")
+
+
+SPARK_LEVELS = " ▁▂▃▄▅▆▇█"
+
+
+def sparkline(values: list) -> str:
+    """One character per value, scaled to the largest."""
+    peak = max(values, default=0)
+    if not peak:
+        return " " * len(values)
+    top = len(SPARK_LEVELS) - 1
+    return "".join(SPARK_LEVELS[math.ceil(v / peak * top)] for v in values)
+
+
+def format_count(value: float) -> str:
+    """Render a sample count or weight, without '.0' on whole numbers."""
+    return str(int(value)) if float(value).is_integer() else f"{value:.3f}"
+
+
+class LibraryIndex:
+    """Address -> library lookup over sorted (start, end, name) ranges.
+
+    A lookup bisects to the last range starting at or below the address and
+    checks its end, so addresses in gaps between libraries map to "unknown".
+    Overlapping ranges resolve to the innermost (latest-starting) range that
+    contains the address; ranges with the same start are ordered widest
+    first so the narrowest is found first. The running maximum of ends
+    tells the lookup when no earlier range can reach it. A missing end is
+    treated as open-ended.
+    """
+
+    def __init__(self, ranges: Iterable[tuple]):
+        self.ranges = sorted(ranges, key=lambda r: (r[0], -(math.inf if r[1] is None else r[1])))
+        self.starts = [start for start, _, _ in self.ranges]
+        self.max_ends = list(accumulate(
+            (math.inf if end is None else end for _, end, _ in self.ranges), max))
+
+    def lookup(self, addr: int) -> str:
+        i = bisect_right(self.starts, addr) - 1
+        while i >= 0 and self.max_ends[i] > addr:
+            _, end, name = self.ranges[i]
+            if end is None or addr < end:
+                return name
+            i -= 1
         return "unknown"
 
-    def _resolve_frame_name(self, thread: dict, frame_idx: int) -> tuple[str, str]:
-        """Resolve frame index to (function_name, library)."""
+
+INLINE_MODES = ("expand", "collapse")
+
+
+class FrameTable:
+    """Per-thread frame index -> (function_name, library) table.
+
+    Every frame in the thread's frameTable is resolved once up front, so
+    analysis never goes back to the string, symbol or func tables. Demangled
+    names come from a shared pool and are interned, so the same symbol seen
+    in many threads (or both sides of a diff) is a single string.
+
+    With locations=True each frame's (file, line) and instruction address
+    are resolved in the same pass, None where the profile has none. An
+    index of -1, as streamed columns hold for null, counts as missing.
+
+    Frames with an inlineDepth above 0 stand for functions inlined into a
+    physical frame and share its native symbol. With inline="expand" they
+    are named after their own funcTable entry; with "collapse" they are only
+    flagged in `inlined`, for the analyzer to fold into the physical frame.
+    """
+
+    UNKNOWN = ("unknown", "unknown")
+
+    def __init__(self, thread: dict, libs_by_index: list[tuple],
+                 addr_to_lib: Callable[[int], str], names: dict[str, str],
+                 locations: bool = False, inline: str = "expand"):
         string_table = thread.get('stringArray', [])
+        n_strings = len(string_table)
 
-        # Try native symbols first
         ns = thread.get('nativeSymbols', {})
         ns_names = ns.get('name', [])
         ns_libs = ns.get('libIndex', [])
@@ -119,152 +1702,798 @@ class ProfileAnalyzer:
         frame_ns_indices = frame_table.get('nativeSymbol', [])
         frame_func_indices = frame_table.get('func', [])
         frame_addresses = frame_table.get('address', [])
+        func_names = thread.get('funcTable', {}).get('name', [])
+        func_files = thread.get('funcTable', {}).get('fileName', [])
+        frame_lines = frame_table.get('line', [])
+        frame_depths = frame_table.get('inlineDepth', [])
+        expand = inline == "expand"
+
+        def demangled(raw: str) -> str:
+            name = names.get(raw)
+            if name is None:
+                name = names[raw] = sys.intern(demangle_rust(raw))
+            return name
+
+        entries: list[tuple[str, str]] = []
+        pairs: dict[tuple[str, str], tuple[str, str]] = {}
+        lines: list[Optional[tuple[str, int]]] = []
+        addresses: list[Optional[int]] = []
+        n_frames = max(len(frame_ns_indices), len(frame_func_indices), len(frame_addresses))
+        inlined = bytearray(n_frames)
+        for frame_idx in range(n_frames):
+            name = None
+            lib = "unknown"
+            func_idx = frame_func_indices[frame_idx] if frame_idx < len(frame_func_indices) else None
+            if frame_idx < len(frame_depths) and (frame_depths[frame_idx] or 0) > 0:
+                inlined[frame_idx] = 1
+
+            # Try native symbol; an inlined frame's is its physical frame's
+            if frame_idx < len(frame_ns_indices):
+                ns_idx = frame_ns_indices[frame_idx]
+                if ns_idx is not None and 0 <= ns_idx < len(ns_names):
+                    name_idx = ns_names[ns_idx]
+                    if (isinstance(name_idx, int) and 0 <= name_idx < n_strings
+                            and not (expand and inlined[frame_idx])):
+                        name = string_table[name_idx]
+                    if ns_idx < len(ns_libs):
+                        lib_idx = ns_libs[ns_idx]
+                        if lib_idx is not None and 0 <= lib_idx < len(libs_by_index):
+                            lib = libs_by_index[lib_idx][2]
+
+            # Fallback to func table
+            if not name and func_idx is not None and 0 <= func_idx < len(func_names):
+                name_idx = func_names[func_idx]
+                if isinstance(name_idx, int) and 0 <= name_idx < n_strings:
+                    name = string_table[name_idx]
 
-        name = None
-        lib = "unknown"
+            # Fallback to address
+            if not name and frame_idx < len(frame_addresses):
+                addr = frame_addresses[frame_idx]
+                if addr is not None and addr >= 0:
+                    lib = addr_to_lib(addr)
+                    name = f"0x{addr:x}"
+
+            entry = (demangled(name) if name else "unknown", lib)
+            entries.append(pairs.setdefault(entry, entry))
+
+            if locations:
+                line = frame_lines[frame_idx] if frame_idx < len(frame_lines) else None
+                file = None
+                if (line is not None and line >= 0 and func_idx is not None
+                        and 0 <= func_idx < len(func_files)):
+                    file_idx = func_files[func_idx]
+                    if isinstance(file_idx, int) and 0 <= file_idx < n_strings:
+                        file = sys.intern(string_table[file_idx])
+                lines.append((file, line) if file is not None else None)
+                addr = frame_addresses[frame_idx] if frame_idx < len(frame_addresses) else None
+                addresses.append(addr if addr is not None and addr >= 0 else None)
+
+        self.entries = entries
+        self.lines = lines
+        self.addresses = addresses
+        self.inlined = inlined if any(inlined) else None
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __getitem__(self, frame_idx: int) -> tuple[str, str]:
+        if frame_idx is None or not 0 <= frame_idx < len(self.entries):
+            return self.UNKNOWN
+        return self.entries[frame_idx]
 
-        # Try native symbol
-        if frame_idx < len(frame_ns_indices):
-            ns_idx = frame_ns_indices[frame_idx]
-            if ns_idx is not None and ns_idx < len(ns_names):
-                name_idx = ns_names[ns_idx]
-                if isinstance(name_idx, int) and name_idx < len(string_table):
-                    name = string_table[name_idx]
-                if ns_idx < len(ns_libs):
-                    lib_idx = ns_libs[ns_idx]
-                    if lib_idx is not None and lib_idx < len(self.libs_by_index):
-                        lib = self.libs_by_index[lib_idx][2]
-
-        # Fallback to func table
-        if not name:
-            func_table = thread.get('funcTable', {})
-            func_names = func_table.get('name', [])
-            if frame_idx < len(frame_func_indices):
-                func_idx = frame_func_indices[frame_idx]
-                if func_idx is not None and func_idx < len(func_names):
-                    name_idx = func_names[func_idx]
-                    if isinstance(name_idx, int) and name_idx < len(string_table):
-                        name = string_table[name_idx]
 
-        # Fallback to address
-        if not name and frame_idx < len(frame_addresses):
-            addr = frame_addresses[frame_idx]
-            if addr is not None:
-                lib = self._addr_to_lib(addr)
-                name = f"0x{addr:x}"
+class ProfileAnalyzer:
+    """Analyzes samply/Firefox Profiler JSON files."""
 
-        return (demangle_rust(name) if name else "unknown", lib)
+    def __init__(self, data: dict, names: Optional[dict[str, str]] = None,
+                 weight: str = "auto", time_range: Optional[tuple] = None,
+                 timeline: bool = False, locations: bool = False, inline: str = "expand",
+                 call_trees: bool = False):
+        self.data = data
+        # How samples are weighted; see sample_weights().
+        self.weight = weight
+        # (start_ms, end_ms) window on samples.time; either end may be None.
+        self.time_range = time_range
+        # Keep each sample's time and leaf function for timeline().
+        self.timeline = timeline
+        # Build per-thread call trees for the tree, folded and crate views.
+        # Timeline series name their leaf functions by call tree id.
+        self.call_trees = call_trees or timeline
+        # Count time per source line and instruction address as well.
+        self.locations = locations
+        # Inlined frames: "expand" into their own functions, or "collapse"
+        # into the physical frame they were inlined into.
+        self.inline = inline
+        self.libs_by_index, self.lib_index = self._load_libs()
+        self.threads = data.get('threads', [])
+        self.functions = FunctionTable()
+        self.lines, self.addresses = self._location_tables()
+        self.total_samples = 0
+        self.weight_squares = 0
+        # Per-thread partitions, in file order; the totals above are merged
+        # from these and can be re-merged for a different thread selection.
+        self.thread_results: list[ThreadResult] = []
+        self.thread_filter: Optional[str] = None
+        self._call_tree: Optional[CallTree] = None
+        # Raw symbol -> demangled, interned name. Pass another analyzer's
+        # pool (as diff mode does) to share strings between profiles.
+        self.names: dict[str, str] = names if names is not None else {}
+        self._frame_tables: dict[int, FrameTable] = {}
+
+    def _load_libs(self) -> tuple[list[tuple], "LibraryIndex"]:
+        """Load library address ranges and preserve original order for libIndex."""
+        libs = self.data.get('libs', [])
+        lib_ranges = []
+        for lib in libs:
+            name = lib.get('name') or lib.get('debugName') or Path(lib.get('path', '')).name or 'unknown'
+            start = lib.get('start', 0)
+            end = lib.get('end')
+            lib_ranges.append((start, end, name))
+        return lib_ranges, LibraryIndex(lib_ranges)
+
+    def _addr_to_lib(self, addr: int) -> str:
+        """Map address to library name."""
+        return self.lib_index.lookup(addr)
 
-    def analyze(self, thread_filter: Optional[str] = None):
-        """Analyze all threads (or filtered thread)."""
+    def frame_table(self, thread: dict) -> "FrameTable":
+        """Get the resolution table for a thread, building it on first use."""
+        table = self._frame_tables.get(id(thread))
+        if table is None:
+            table = FrameTable(thread, self.libs_by_index, self._addr_to_lib, self.names,
+                               locations=self.locations, inline=self.inline)
+            self._frame_tables[id(thread)] = table
+        return table
+
+    def _resolve_frame_name(self, thread: dict, frame_idx: int) -> tuple[str, str]:
+        """Resolve frame index to (function_name, library)."""
+        return self.frame_table(thread)[frame_idx]
+
+    def analyze(self, thread_filter: Optional[str] = None, jobs: int = 1):
+        """Analyze all threads (or filtered thread).
+
+        Each thread is aggregated on its own and merged in file order, so the
+        result is the same whether threads are analyzed serially or by a pool
+        of `jobs` worker processes. When threads come from stream_profile they
+        are consumed here and each is released once it has been aggregated.
+        """
+        streaming = not isinstance(self.threads, list)
+        self.thread_filter = thread_filter
+        selected = self._select_threads(thread_filter)
+        if jobs > 1:
+            results = _analyze_in_pool(selected, self.data.get('libs', []), jobs, self.options)
+        else:
+            def analyze_one(thread: dict) -> ThreadResult:
+                result = self._analyze_thread(thread)
+                if streaming:
+                    self._frame_tables.pop(id(thread), None)
+                return result
+            results = map(analyze_one, selected)
+
+        for result in results:
+            self.thread_results.append(result)
+            self._merge(result)
+        if streaming:
+            self.threads = []
+
+    @property
+    def options(self) -> dict:
+        """Analysis options that change aggregated results."""
+        return {'weight': self.weight, 'time_range': self.time_range, 'timeline': self.timeline,
+                'locations': self.locations, 'inline': self.inline, 'call_trees': self.call_trees}
+
+    def _location_tables(self) -> tuple[Optional[LocationTable], Optional[LocationTable]]:
+        """Empty (lines, addresses) tables, or Nones without locations."""
+        if not self.locations:
+            return None, None
+        return LocationTable(), LocationTable()
+
+    def merge_threads(self, thread_filter: Optional[str] = None):
+        """Rebuild the profile totals from the per-thread results.
+
+        Only threads whose name contains thread_filter are included, so a
+        different selection never needs the samples walked again.
+        """
+        self.functions = FunctionTable()
+        self.lines, self.addresses = self._location_tables()
+        self.total_samples = 0
+        self.weight_squares = 0
+        self._call_tree = None
+        self.thread_filter = thread_filter
+        for result in self.selected_results():
+            self._merge(result)
+
+    @property
+    def weighting(self) -> list[str]:
+        """Weightings actually applied to the selected threads' samples."""
+        applied: dict[str, None] = {}
+        for result in self.selected_results():
+            applied.update(dict.fromkeys(result.weighting))
+        return list(applied)
+
+    def unweighted_threads(self) -> list[str]:
+        """Selected threads counted 1 per sample although --weight weight or
+        cpu asked for a column they do not have."""
+        if self.weight not in ("weight", "cpu"):
+            return []
+        return [r.name for r in self.selected_results() if "samples" in r.weighting]
+
+    @property
+    def effective_samples(self) -> float:
+        """Kish effective sample size (sum w)^2 / sum w^2 of the selection.
+
+        This is the sample count when every sample counts 1. With weights
+        it is the number of equally weighted samples that would estimate a
+        share as precisely, so a few heavy samples do not pass for many.
+        """
+        if not self.weight_squares:
+            if self.total_samples:
+                raise ValueError("sample weights were not recorded; "
+                                 "cannot size a significance test")
+            return 0.0
+        return self.total_samples * self.total_samples / self.weight_squares
+
+    def _require_call_trees(self):
+        if not self.call_trees:
+            raise ValueError("call trees were not built; analyze with call_trees=True")
+
+    @property
+    def call_tree(self) -> CallTree:
+        """Call tree of the selected threads, merged on first use."""
+        self._require_call_trees()
+        if self._call_tree is None:
+            selected = self.selected_results()
+            if len(selected) == 1:
+                self._call_tree = selected[0].call_tree
+            else:
+                self._call_tree = CallTree()
+                for result in selected:
+                    self._call_tree.merge(result.call_tree)
+        return self._call_tree
+
+    def selected_results(self) -> list[ThreadResult]:
+        """Per-thread results included in the current totals."""
+        thread_filter = self.thread_filter
+        return [r for r in self.thread_results
+                if not thread_filter or thread_filter.lower() in r.name.lower()]
+
+    def _select_threads(self, thread_filter: Optional[str]) -> Iterator[dict]:
+        """Yield threads whose name contains thread_filter (all if None)."""
         for thread in self.threads:
             thread_name = thread.get('name', 'Unknown')
-            if thread_filter and thread_filter.lower() not in thread_name.lower():
-                continue
-            self._analyze_thread(thread)
-
-    def _analyze_thread(self, thread: dict):
-        """Analyze a single thread."""
+            if not thread_filter or thread_filter.lower() in thread_name.lower():
+                yield thread
+            # Drop the reference before the next streamed thread is parsed.
+            del thread
+
+    def _merge(self, result: ThreadResult):
+        """Add one thread's statistics to the profile totals."""
+        self.total_samples += result.total_samples
+        self.weight_squares += result.weight_squares
+        self._call_tree = None
+        fids = self.functions.merge(result.functions)
+        if self.lines is not None and result.lines is not None:
+            self.lines.merge(result.lines, fids)
+            self.addresses.merge(result.addresses, fids)
+
+    def _analyze_thread(self, thread: dict) -> ThreadResult:
+        """Analyze a single thread.
+
+        Samples are bucketed by stack index first, so each distinct
+        stackTable row is resolved exactly once no matter how many samples
+        share it. Counts are then pushed up the prefix tree: a row's
+        inclusive count is the number of samples whose stack passes through
+        it, which is what total time and caller/callee edges are made of.
+        Like total time, an edge is counted once per sample however often
+        recursion repeats it on the stack. With sample weights every count
+        above is a weight sum instead, and with a time range only samples
+        inside the window are counted. Line and address counts reuse the
+        same rows and inclusive counts. When inlined frames are collapsed,
+        their rows are replaced by the physical frame's row before any of
+        this.
+        """
         samples = thread.get('samples', {})
-        stack_indices = samples.get('stack', [])
+        if self.time_range is not None:
+            samples = slice_samples(samples, *self.time_range)
+        counts = sample_weights(samples, self.weight)
+        total = sum(counts.values())
+        weights = weight_column(samples, self.weight)
+        if weights is not None:
+            squares = sum(w * w for stack_idx, w in zip(samples.get('stack', []), weights)
+                          if w and stack_idx is not None and stack_idx >= 0)
+        else:
+            squares = total
+        result = ThreadResult(name=thread.get('name', 'Unknown'), total_samples=total,
+                              weight_squares=squares,
+                              weighting=(applied_weighting(samples, self.weight),) if total else (),
+                              call_tree=CallTree() if self.call_trees else None)
 
         stack_table = thread.get('stackTable', {})
         stack_frames = stack_table.get('frame', [])
         stack_prefixes = stack_table.get('prefix', [])
-
-        for stack_idx in stack_indices:
-            if stack_idx is None:
+        functions = result.functions
+        frames = self.frame_table(thread)
+        sampled_rows = None
+        if self.inline == "collapse" and frames.inlined is not None:
+            counts, stack_prefixes, sampled_rows = self._collapse_inlined(
+                counts, stack_frames, stack_prefixes, frames.inlined)
+        n_stacks = len(stack_frames)
+        n_prefixes = len(stack_prefixes)
+
+        # Resolve every row reachable from a sampled stack, leaf to root, in
+        # order of first appearance. A walk stops at the first row already
+        # seen because its whole prefix chain was resolved then, which keeps
+        # function registration order identical to a per-sample walk. Per-row
+        # state lives in arrays indexed by row, -1 meaning none.
+        row_fids = array('q', [-1]) * n_stacks
+        parents = array('q', [-1]) * n_stacks
+        reached = array('q')
+        for stack_idx in counts:
+            row = stack_idx
+            while row is not None and 0 <= row < n_stacks and row_fids[row] < 0:
+                row_fids[row] = functions.intern(*frames[stack_frames[row]])
+                prefix = stack_prefixes[row] if row < n_prefixes else None
+                if prefix is None or not 0 <= prefix < n_stacks:
+                    prefix = -1
+                parents[row] = prefix
+                reached.append(row)
+                row = prefix
+
+        # Children as linked lists, newest first, so that pushing a row's
+        # children in list order pops them in order of appearance.
+        first_child = array('q', [-1]) * n_stacks
+        next_sibling = array('q', [-1]) * n_stacks
+        first_root = -1
+        for row in reached:
+            prefix = parents[row]
+            if prefix < 0:
+                next_sibling[row] = first_root
+                first_root = row
+            else:
+                next_sibling[row] = first_child[prefix]
+                first_child[prefix] = row
+
+        # Depth-first over the reachable prefix tree. A row counts towards
+        # its function's total only when that function is not already on
+        # the path above it, so recursion is counted once per sample; the
+        # row -> prefix edge likewise only when that edge is not already on
+        # the path. Rows with the same function path share one call tree node,
+        # when call trees are built. A row is pushed again as ~row to be left.
+        tree = result.call_tree
+        names = functions.names
+        nodes = array('q', [-1]) * (n_stacks if tree is not None else 0)
+        edge_keys = array('q', [-1]) * n_stacks
+        counted_edges = bytearray(n_stacks)
+        preorder = array('q')
+        outermost = array('q')
+        on_path = array('q', [0]) * len(names)
+        edges_on_path = Counter()
+        pending = array('q')
+        child = first_root
+        while child >= 0:
+            pending.append(child)
+            child = next_sibling[child]
+        while pending:
+            row = pending.pop()
+            if row < 0:
+                row = ~row
+                on_path[row_fids[row]] -= 1
+                key = edge_keys[row]
+                if key >= 0:
+                    edges_on_path[key] -= 1
                 continue
-
-            self.total_samples += 1
-
-            # Walk the stack
-            seen_in_stack = set()
-            prev_name = None
-            current_idx = stack_idx
-            is_leaf = True
-
-            while current_idx is not None and current_idx < len(stack_frames):
-                frame_idx = stack_frames[current_idx]
-                name, lib = self._resolve_frame_name(thread, frame_idx)
-
-                # Get or create function stats
-                if name not in self.functions:
-                    self.functions[name] = FunctionStats(name=name, library=lib)
-                stats = self.functions[name]
-
-                # Self time (leaf frame only)
-                if is_leaf:
-                    stats.self_samples += 1
-                    is_leaf = False
-
-                # Total time (count once per stack)
-                if name not in seen_in_stack:
-                    stats.total_samples += 1
-                    seen_in_stack.add(name)
-
-                # Track caller/callee relationships
-                if prev_name and prev_name != name:
-                    stats.callees[prev_name] += 1
-                    if prev_name in self.functions:
-                        self.functions[prev_name].callers[name] += 1
-
-                prev_name = name
-
-                # Move to parent frame
-                if current_idx < len(stack_prefixes):
-                    current_idx = stack_prefixes[current_idx]
-                else:
-                    break
+            fid = row_fids[row]
+            if not on_path[fid]:
+                outermost.append(row)
+            on_path[fid] += 1
+            prefix = parents[row]
+            if tree is not None:
+                nodes[row] = tree.child(tree.ROOT if prefix < 0 else nodes[prefix], names[fid])
+            if prefix >= 0:
+                caller, callee = row_fids[prefix], fid
+                if caller != callee:
+                    key = edge_keys[row] = (caller << 32) | callee
+                    if not edges_on_path[key]:
+                        counted_edges[row] = 1
+                    edges_on_path[key] += 1
+            preorder.append(row)
+            pending.append(~row)
+            child = first_child[row]
+            while child >= 0:
+                pending.append(child)
+                child = next_sibling[child]
+
+        inclusive = array('d', bytes(8 * n_stacks))
+        for stack_idx, count in counts.items():
+            if 0 <= stack_idx < n_stacks:
+                inclusive[stack_idx] = count
+        for row in reversed(preorder):
+            prefix = parents[row]
+            if prefix >= 0:
+                inclusive[prefix] += inclusive[row]
+
+        self_samples = functions.self_samples
+        for stack_idx, count in counts.items():
+            if 0 <= stack_idx < n_stacks and row_fids[stack_idx] >= 0:
+                self_samples[row_fids[stack_idx]] += count
+
+        if tree is not None:
+            tree.total_samples[tree.ROOT] = result.total_samples
+            for row in preorder:
+                node = nodes[row]
+                tree.self_samples[node] += counts.get(row, 0)
+                tree.total_samples[node] += inclusive[row]
+
+        if self.timeline:
+            if sampled_rows is None:
+                sampled_rows = {stack_idx: stack_idx for stack_idx in counts}
+            result.series = self._sample_series(samples, {
+                stack_idx: tree.func[nodes[row]] for stack_idx, row in sampled_rows.items()
+                if 0 <= row < n_stacks and row_fids[row] >= 0})
+
+        total_samples = functions.total_samples
+        for row in outermost:
+            total_samples[row_fids[row]] += inclusive[row]
+
+        if self.locations:
+            self._count_locations(result, frames, stack_frames, row_fids, counts,
+                                  outermost, inclusive)
+
+        # Every sample through a counted row crosses its edge once. Edges
+        # are registered at their first row, as a per-sample walk would.
+        edges: dict[int, float] = {}
+        for row in reached:
+            key = edge_keys[row]
+            if key >= 0:
+                edges[key] = edges.get(key, 0) + (inclusive[row] if counted_edges[row] else 0)
+        functions.edge_keys = array('q', edges)
+        functions.edge_weights = array('d', edges.values())
+
+        functions.compact()
+        if tree is not None:
+            tree.compact()
+        return result
+
+    @staticmethod
+    def _collapse_inlined(counts: dict[int, float], stack_frames: list, stack_prefixes: list,
+                          inlined: bytearray) -> tuple[dict[int, float], list, dict[int, int]]:
+        """Fold rows of inlined frames into the row of their physical frame.
+
+        Every row stands in for its nearest ancestor-or-self whose frame is
+        not inlined. Returns the counts keyed by those rows, a prefix column
+        that skips inlined rows, and each sampled row's replacement.
+        """
+        n_stacks = len(stack_frames)
+        n_prefixes = len(stack_prefixes)
+        n_frames = len(inlined)
+
+        def physical(row: Optional[int]) -> Optional[int]:
+            while row is not None and 0 <= row < n_stacks:
+                frame_idx = stack_frames[row]
+                if frame_idx is None or not 0 <= frame_idx < n_frames or not inlined[frame_idx]:
+                    return row
+                row = stack_prefixes[row] if row < n_prefixes else None
+            return None if row is not None and row < 0 else row
+
+        prefixes = [physical(prefix) for prefix in stack_prefixes]
+        sampled_rows: dict[int, int] = {}
+        collapsed: dict[int, float] = {}
+        for stack_idx, count in counts.items():
+            # A stack made only of inlined frames keeps its own leaf.
+            row = physical(stack_idx)
+            if row is None:
+                row = stack_idx
+            sampled_rows[stack_idx] = row
+            collapsed[row] = collapsed.get(row, 0) + count
+        return collapsed, prefixes, sampled_rows
+
+    def _count_locations(self, result: ThreadResult, frames: FrameTable, stack_frames: list,
+                         row_fids: array, counts: dict[int, float],
+                         outermost: array, inclusive: array):
+        """Attribute self time to each sampled row's line and address, and
+        total time to those of each function's outermost row."""
+        lines = result.lines = LocationTable()
+        addresses = result.addresses = LocationTable()
+        n_frames = len(frames.lines)
+
+        def add(row: int, own: float, total: float):
+            frame_idx = stack_frames[row]
+            if frame_idx is None or not 0 <= frame_idx < n_frames:
+                return
+            fid = row_fids[row]
+            line = frames.lines[frame_idx]
+            if line is not None:
+                lines.add(fid, line[0], line[1], own, total)
+            address = frames.addresses[frame_idx]
+            if address is not None:
+                addresses.add(fid, "", address, own, total)
+
+        for stack_idx, count in counts.items():
+            if 0 <= stack_idx < len(row_fids) and row_fids[stack_idx] >= 0:
+                add(stack_idx, count, 0)
+        for row in outermost:
+            add(row, 0, inclusive[row])
+        lines.compact()
+        addresses.compact()
+
+    def _sample_series(self, samples: dict, leaf_fids: dict[int, int]) -> tuple[array, array, array]:
+        """Per-sample (time, leaf function id, weight) columns for timeline()."""
+        times, fids, weights = array('d'), array('q'), array('d')
+        weight_col = weight_column(samples, self.weight)
+        for i, (stack_idx, t) in enumerate(zip(samples.get('stack', []), sample_times(samples))):
+            fid = leaf_fids.get(stack_idx)
+            weight = weight_col[i] if weight_col is not None else 1
+            if fid is None or not weight:
+                continue
+            times.append(t)
+            fids.append(fid)
+            weights.append(weight)
+        return times, fids, weights
 
     def get_hot_functions(self, by: str = "self", top_n: int = 20,
                           lib_filter: Optional[str] = None,
                           min_pct: float = 0.0) -> list[FunctionStats]:
         """Get hottest functions sorted by self or total time."""
-        funcs = list(self.functions.values())
+        functions = self.functions
+        counts = functions.self_samples if by == "self" else functions.total_samples
+        fids = range(len(functions))
 
         # Filter by library
         if lib_filter:
-            funcs = [f for f in funcs if lib_filter.lower() in f.library.lower()]
+            needle = lib_filter.lower()
+            libraries = functions.libraries
+            fids = [fid for fid in fids if needle in libraries[fid].lower()]
 
         # Filter by minimum percentage
         if min_pct > 0 and self.total_samples > 0:
             threshold = self.total_samples * (min_pct / 100.0)
-            key = 'self_samples' if by == 'self' else 'total_samples'
-            funcs = [f for f in funcs if getattr(f, key) >= threshold]
+            fids = [fid for fid in fids if counts[fid] >= threshold]
 
         # Sort
-        if by == "self":
-            funcs.sort(key=lambda f: f.self_samples, reverse=True)
-        else:
-            funcs.sort(key=lambda f: f.total_samples, reverse=True)
-
-        return funcs[:top_n]
+        fids = sorted(fids, key=counts.__getitem__, reverse=True)
+        return [functions.view(fid) for fid in fids[:top_n]]
 
     def get_library_breakdown(self) -> dict[str, dict]:
         """Get samples grouped by library."""
         libs = defaultdict(lambda: {"self": 0, "total": 0, "functions": 0})
-        for func in self.functions.values():
-            libs[func.library]["self"] += func.self_samples
-            libs[func.library]["total"] += func.total_samples
-            libs[func.library]["functions"] += 1
+        functions = self.functions
+        for library, own, total in zip(functions.libraries, functions.self_samples,
+                                       functions.total_samples):
+            stats = libs[library]
+            stats["self"] += own
+            stats["total"] += total
+            stats["functions"] += 1
+        for stats in libs.values():
+            stats["self"], stats["total"] = _count(stats["self"]), _count(stats["total"])
         return dict(sorted(libs.items(), key=lambda x: x[1]["self"], reverse=True))
 
-    def get_callers(self, func_name: str, top_n: int = 10) -> list[tuple[str, int]]:
-        """Get top callers of a function."""
-        for name, stats in self.functions.items():
-            if func_name.lower() in name.lower():
-                callers = sorted(stats.callers.items(), key=lambda x: x[1], reverse=True)
-                return callers[:top_n]
-        return []
-
-    def get_callees(self, func_name: str, top_n: int = 10) -> list[tuple[str, int]]:
-        """Get top callees of a function."""
-        for name, stats in self.functions.items():
-            if func_name.lower() in name.lower():
-                callees = sorted(stats.callees.items(), key=lambda x: x[1], reverse=True)
-                return callees[:top_n]
-        return []
+    def group_threads(self, patterns: Iterable[str] = DEFAULT_THREAD_GROUPS) -> list[ThreadGroup]:
+        """Merge the selected threads into groups by name pattern, hottest first.
+
+        Groups are built from the per-thread results, so regrouping with
+        other patterns never walks the samples again.
+        """
+        compiled = compile_thread_groups(patterns)
+        groups: dict[str, ThreadGroup] = {}
+        for result in self.selected_results():
+            name = thread_group_name(result.name, compiled)
+            group = groups.get(name)
+            if group is None:
+                group = groups[name] = ThreadGroup(name)
+            group.add(result)
+        for group in groups.values():
+            group.functions.compact()
+        return sorted(groups.values(), key=lambda g: g.total_samples, reverse=True)
+
+    def get_thread_groups(self, patterns: Iterable[str] = DEFAULT_THREAD_GROUPS,
+                          top_n: int = 10) -> list[dict]:
+        """Per-group sample counts and hottest functions, for JSON output."""
+        total = self.total_samples
+        groups = []
+        for group in self.group_threads(patterns):
+            functions = group.functions
+            hot = sorted(range(len(functions)), key=functions.self_samples.__getitem__,
+                         reverse=True)[:top_n]
+            groups.append({
+                "name": group.name,
+                "threads": group.threads,
+                "samples": group.total_samples,
+                "pct": round(group.total_samples / total * 100, 2) if total else 0,
+                "functions": [{"name": functions.names[fid],
+                               "library": functions.libraries[fid],
+                               "self_samples": _count(functions.self_samples[fid]),
+                               "total_samples": _count(functions.total_samples[fid])}
+                              for fid in hot],
+            })
+        return groups
+
+    def print_thread_groups(self, patterns: Iterable[str] = DEFAULT_THREAD_GROUPS):
+        """Print samples per thread group with each group's hottest function."""
+        total = self.total_samples
+        print(f"\n{'='*70}")
+        print(f"THREAD GROUPS")
+        print(f"{'='*70}")
+        print(f"{'Group':<28} {'Threads':>7} {'Samples':>10} {'Share':>6}  {'Hottest (self % of group)'}")
+        print(f"{'-'*70}")
+        for group in self.group_threads(patterns):
+            functions = group.functions
+            pct = (group.total_samples / total * 100) if total else 0
+            hottest = ""
+            if len(functions):
+                fid = max(range(len(functions)), key=functions.self_samples.__getitem__)
+                own = (functions.self_samples[fid] / group.total_samples * 100) if group.total_samples else 0
+                hottest = f"{shorten_name(functions.names[fid], 40)} ({own:.1f}%)"
+            print(f"{shorten_name(group.name, 28):<28} {len(group.threads):>7} "
+                  f"{group.total_samples:>10,} {pct:>5.1f}%  {hottest}")
+
+    def namespace_tree(self) -> CallTree:
+        """Crate -> module -> function roll-up of the selected threads.
+
+        A prefix tree of namespace_path() segments with one node per crate,
+        module and function; each function's path is split and inserted
+        once. A node's self time is the self time of every function under
+        it. Its total counts each sample once even when several of its
+        functions are on the stack, so it is accumulated over the call tree
+        like function totals: a call path adds to a node only when that node
+        is not already on the path above it. Samples are never revisited.
+        """
+        self._require_call_trees()
+        rollup = CallTree()
+        functions = self.functions
+        paths: dict[str, list[int]] = {}
+
+        def path_nodes(name: str, library: str) -> list[int]:
+            nodes = paths.get(name)
+            if nodes is None:
+                nodes = paths[name] = []
+                node = rollup.ROOT
+                for segment in namespace_path(name, library):
+                    node = rollup.child(node, segment)
+                    nodes.append(node)
+            return nodes
+
+        self_samples = rollup.self_samples
+        for name, library, own in zip(functions.names, functions.libraries,
+                                      functions.self_samples):
+            for node in path_nodes(name, library):
+                self_samples[node] += own
+
+        # Per-thread totals add up, so the threads' trees are walked one by
+        # one unless they have been merged already.
+        ids = functions.ids
+        total_samples = rollup.total_samples
+        on_path = [0] * len(rollup)
+        trees = ([self._call_tree] if self._call_tree is not None
+                 else [result.call_tree for result in self.selected_results()])
+        for tree in trees:
+            tree_paths = [path_nodes(name, functions.libraries[ids[name]] if name in ids else "unknown")
+                          for name in tree.names]
+            on_path.extend([0] * (len(rollup) - len(on_path)))
+            children = tree.children
+
+            # Depth-first; a negative entry leaves the node of that id.
+            total_samples[rollup.ROOT] += tree.total_samples[tree.ROOT]
+            tree_func, tree_total = tree.func, tree.total_samples
+            pending = list(children(tree.ROOT))
+            while pending:
+                node = pending.pop()
+                if node < 0:
+                    for rolled in tree_paths[tree_func[~node]]:
+                        on_path[rolled] -= 1
+                    continue
+                weight = tree_total[node]
+                for rolled in tree_paths[tree_func[node]]:
+                    if not on_path[rolled]:
+                        total_samples[rolled] += weight
+                    on_path[rolled] += 1
+                pending.append(~node)
+                pending.extend(children(node))
+        rollup.compact()
+        return rollup
+
+    def get_crate_rollup(self, max_depth: int = 5, min_pct: float = 0.0) -> list[dict]:
+        """Nested crate/module/function totals, hottest first, pruned like the call tree."""
+        tree = self.namespace_tree()
+        threshold = self.total_samples * (min_pct / 100.0)
+
+        def entries(node: int, depth: int) -> list[dict]:
+            if depth > max_depth:
+                return []
+            return [{"name": tree.name(child),
+                     "self_samples": _count(tree.self_samples[child]),
+                     "total_samples": _count(tree.total_samples[child]),
+                     "children": entries(child, depth + 1)}
+                    for child in tree.children(node) if tree.total_samples[child] >= threshold]
+        return entries(tree.ROOT, 0)
+
+    def print_crate_rollup(self, max_depth: int = 5, min_pct: float = 1.0):
+        """Print time rolled up by crate, then module path, then function."""
+        print(f"\n{'='*70}")
+        print(f"CRATE ROLL-UP (min {min_pct}% of samples, depth {max_depth})")
+        print(f"{'='*70}")
+        self._print_tree(self.namespace_tree(), max_depth, min_pct)
+
+    def find_functions(self, query: str, match: str = "substring") -> list[FunctionStats]:
+        """Every function whose name matches query, in registration order."""
+        return [self.functions.view(fid) for fid in self.functions.find(query, match)]
+
+    def get_callers(self, func_name: str, top_n: int = 10,
+                    match: str = "substring") -> list[tuple[str, int]]:
+        """Get top callers of the functions matching func_name, summed."""
+        fids = self.functions.find(func_name, match)
+        callers = self.functions.edge_totals(fids, callers=True)
+        return sorted(callers.items(), key=lambda x: x[1], reverse=True)[:top_n]
+
+    def get_callees(self, func_name: str, top_n: int = 10,
+                    match: str = "substring") -> list[tuple[str, int]]:
+        """Get top callees of the functions matching func_name, summed."""
+        fids = self.functions.find(func_name, match)
+        callees = self.functions.edge_totals(fids, callers=False)
+        return sorted(callees.items(), key=lambda x: x[1], reverse=True)[:top_n]
+
+    def get_hot_locations(self, kind: str = "line", by: str = "self", top_n: int = 20,
+                          lib_filter: Optional[str] = None, func_name: Optional[str] = None,
+                          match: str = "substring") -> list[dict]:
+        """Hottest source lines (kind="line") or instruction addresses
+        (kind="address"), optionally only within functions matching func_name."""
+        if not self.locations:
+            raise ValueError("line and address counts need an analyzer with locations=True")
+        table = self.lines if kind == "line" else self.addresses
+        functions = self.functions
+        counts = table.self_samples if by == "self" else table.total_samples
+        rows = range(len(table))
+        if func_name is not None:
+            wanted = set(functions.find(func_name, match))
+            rows = [i for i in rows if table.fids[i] in wanted]
+        if lib_filter:
+            needle = lib_filter.lower()
+            libraries = functions.libraries
+            rows = [i for i in rows if needle in libraries[table.fids[i]].lower()]
+        rows = sorted(rows, key=counts.__getitem__, reverse=True)[:top_n]
+
+        hot = []
+        for i in rows:
+            fid = table.fids[i]
+            entry = {"function": functions.names[fid], "library": functions.libraries[fid]}
+            if kind == "line":
+                entry["file"] = table.files[i]
+                entry["line"] = table.positions[i]
+            else:
+                entry["address"] = table.positions[i]
+            entry["self_samples"] = _count(table.self_samples[i])
+            entry["total_samples"] = _count(table.total_samples[i])
+            hot.append(entry)
+        return hot
+
+    def print_hot_locations(self, kind: str = "line", top_n: int = 20,
+                            lib_filter: Optional[str] = None,
+                            func_name: Optional[str] = None, match: str = "substring"):
+        """Print the hottest lines or addresses, profile-wide by self time or
+        within the functions matching func_name by total time."""
+        if func_name is not None and not self.find_functions(func_name, match):
+            print(f"No function matching '{func_name}' found.")
+            return
+        by = "self" if func_name is None else "total"
+        hot = self.get_hot_locations(kind, by=by, top_n=top_n, lib_filter=lib_filter,
+                                     func_name=func_name, match=match)
+        title = "SOURCE LINES" if kind == "line" else "ADDRESSES"
+        scope = f" IN: {func_name}" if func_name is not None else ""
+        print(f"\n{'='*70}")
+        print(f"HOT {title}{scope} (by {by} time){' - filtered: ' + lib_filter if lib_filter else ''}")
+        print(f"{'='*70}")
+        print(f"{'Samples':>8} {'Self%':>7} {'Total%':>7}  {'Location':<32} {'Function'}")
+        print(f"{'-'*70}")
+        total = self.total_samples
+        for entry in hot:
+            self_pct = (entry['self_samples'] / total * 100) if total else 0
+            total_pct = (entry['total_samples'] / total * 100) if total else 0
+            if kind == "line":
+                location = f"{shorten_path(entry['file'], 32 - len(str(entry['line'])) - 1)}:{entry['line']}"
+            else:
+                location = f"0x{entry['address']:x}"
+            print(f"{format_count(entry[by + '_samples']):>8} {self_pct:>6.1f}% {total_pct:>6.1f}%  "
+                  f"{location:<32} {shorten_name(entry['function'], 50)}")
+        if not hot:
+            print("(no line information)" if kind == "line" else "(no address information)")
 
     def print_summary(self, top_n: int = 20, lib_filter: Optional[str] = None):
         """Print analysis summary."""
@@ -272,6 +2501,13 @@ class ProfileAnalyzer:
         print(f"PROFILE SUMMARY")
         print(f"{'='*70}")
         print(f"Total samples: {self.total_samples:,}")
+        weighting = self.weighting
+        if weighting and weighting != ["samples"]:
+            print(f"Weighted by: {', '.join(weighting)}")
+        elif weighting and self.weight in ("weight", "cpu"):
+            print(f"Weighted by: samples (no {self.weight} column)")
+        if self.time_range is not None:
+            print(f"Time window: {format_window(self.time_range)}")
         print(f"Unique functions: {len(self.functions):,}")
         print(f"Libraries: {len(self.libs_by_index)}")
 
@@ -299,78 +2535,205 @@ class ProfileAnalyzer:
         for func in hot:
             self_pct = (func.self_samples / self.total_samples * 100) if self.total_samples else 0
             total_pct = (func.total_samples / self.total_samples * 100) if self.total_samples else 0
-            print(f"{func.self_samples:>8} {self_pct:>6.1f}% {total_pct:>6.1f}%  {shorten_name(func.name)}")
+            print(f"{format_count(func.self_samples):>8} {self_pct:>6.1f}% {total_pct:>6.1f}%  {shorten_name(func.name)}")
 
-    def print_callers(self, func_name: str):
-        """Print callers of a function."""
-        callers = self.get_callers(func_name)
-        if not callers:
-            print(f"No function matching '{func_name}' found.")
-            return
+    def print_callers(self, func_name: str, match: str = "substring"):
+        """Print callers of the functions matching func_name."""
+        self._print_edges("CALLERS", func_name, match)
 
-        print(f"\n{'='*70}")
-        print(f"CALLERS OF: {func_name}")
-        print(f"{'='*70}")
-        for caller, count in callers:
-            pct = (count / self.total_samples * 100) if self.total_samples else 0
-            print(f"{count:>8} ({pct:>5.1f}%)  {shorten_name(caller)}")
+    def print_callees(self, func_name: str, match: str = "substring"):
+        """Print callees of the functions matching func_name."""
+        self._print_edges("CALLEES", func_name, match)
 
-    def print_callees(self, func_name: str):
-        """Print callees of a function."""
-        callees = self.get_callees(func_name)
-        if not callees:
+    def _print_edges(self, title: str, func_name: str, match: str):
+        matches = self.find_functions(func_name, match)
+        if not matches:
             print(f"No function matching '{func_name}' found.")
             return
+        get = self.get_callers if title == "CALLERS" else self.get_callees
+        edges = get(func_name, match=match)
 
         print(f"\n{'='*70}")
-        print(f"CALLEES OF: {func_name}")
+        print(f"{title} OF: {func_name}")
         print(f"{'='*70}")
-        for callee, count in callees:
+        if len(matches) > 1:
+            print(f"Summed over {len(matches)} matching functions:")
+            for func in sorted(matches, key=lambda f: f.total_samples, reverse=True)[:5]:
+                print(f"  {shorten_name(func.name)}")
+            if len(matches) > 5:
+                print(f"  ... and {len(matches) - 5} more")
+            print()
+        for name, count in edges:
             pct = (count / self.total_samples * 100) if self.total_samples else 0
-            print(f"{count:>8} ({pct:>5.1f}%)  {shorten_name(callee)}")
+            print(f"{format_count(count):>8} ({pct:>5.1f}%)  {shorten_name(name)}")
+        if not edges:
+            print("(none)")
 
     def print_call_tree(self, max_depth: int = 5, min_pct: float = 1.0):
-        """Print a simplified call tree from hot roots."""
+        """Print the call tree, pruned to hot paths.
+
+        Percentages are exact per call path: a node's total is every sample
+        whose stack starts with that path. Pruning by min_pct and max_depth
+        happens while printing, so the tree itself is never rebuilt.
+        """
         print(f"\n{'='*70}")
         print(f"CALL TREE (min {min_pct}% of samples, depth {max_depth})")
         print(f"{'='*70}")
+        self._print_tree(self.call_tree, max_depth, min_pct)
 
-        threshold = self.total_samples * (min_pct / 100.0)
+    def print_inverted_tree(self, max_depth: int = 5, min_pct: float = 1.0):
+        """Print the inverted (bottom-up) call tree.
+
+        Roots are the hottest leaf functions by self time; below each are the
+        caller chains that led to it, weighted by samples.
+        """
+        print(f"\n{'='*70}")
+        print(f"INVERTED CALL TREE (min {min_pct}% of samples, depth {max_depth})")
+        print(f"{'='*70}")
+        self._print_tree(self.call_tree.inverted(max_depth), max_depth, min_pct)
 
-        # Find root functions (high total time, few/no callers)
-        roots = []
-        for func in self.functions.values():
-            if func.total_samples >= threshold:
-                caller_samples = sum(func.callers.values())
-                if caller_samples < func.total_samples * 0.5:  # Less than 50% from tracked callers
-                    roots.append(func)
+    def _print_tree(self, tree: CallTree, max_depth: int, min_pct: float):
+        threshold = self.total_samples * (min_pct / 100.0)
 
-        roots.sort(key=lambda f: f.total_samples, reverse=True)
+        def line(node: int) -> str:
+            pct = (tree.total_samples[node] / self.total_samples * 100) if self.total_samples else 0
+            self_pct = (tree.self_samples[node] / self.total_samples * 100) if self.total_samples else 0
+            return f"{pct:>5.1f}% ({self_pct:>4.1f}% self) {shorten_name(tree.name(node), 50)}"
 
-        def print_tree(func: FunctionStats, depth: int, prefix: str):
+        def print_children(node: int, depth: int, prefix: str):
             if depth > max_depth:
                 return
-            pct = (func.total_samples / self.total_samples * 100) if self.total_samples else 0
-            self_pct = (func.self_samples / self.total_samples * 100) if self.total_samples else 0
+            hot = [c for c in tree.children(node) if tree.total_samples[c] >= threshold]
+            for i, child in enumerate(hot):
+                last = i == len(hot) - 1
+                print(f"{prefix}{'└── ' if last else '├── '}{line(child)}")
+                print_children(child, depth + 1, prefix + ("    " if last else "│   "))
+
+        for root in tree.children(tree.ROOT):
+            if tree.total_samples[root] < threshold:
+                break
+            print(line(root))
+            print_children(root, 1, "")
+            print()
 
-            marker = "└── " if depth > 0 else ""
-            print(f"{prefix}{marker}{pct:>5.1f}% ({self_pct:>4.1f}% self) {shorten_name(func.name, 50)}")
+    def get_timeline(self, buckets: int = 40, top_n: int = 10,
+                     lib_filter: Optional[str] = None) -> dict:
+        """Self time per time bucket for the hottest functions.
 
-            # Print significant callees
-            callees = sorted(func.callees.items(), key=lambda x: x[1], reverse=True)
-            child_prefix = prefix + ("    " if depth > 0 else "")
-            for callee_name, count in callees[:3]:
-                if count >= threshold and callee_name in self.functions:
-                    print_tree(self.functions[callee_name], depth + 1, child_prefix)
+        Functions come from get_hot_functions(); the capture span is split
+        into equal buckets and a single pass over every selected sample adds
+        its weight to one flat array of len(functions) * buckets counters.
+        Needs an analyzer run with timeline=True.
+        """
+        hot = self.get_hot_functions(by="self", top_n=top_n, lib_filter=lib_filter)
+        selected = [r for r in self.selected_results() if r.series is not None and r.series[0]]
+        start = min((r.series[0][0] for r in selected), default=0.0)
+        end = max((r.series[0][-1] for r in selected), default=0.0)
+        if self.time_range is not None:
+            start = self.time_range[0] if self.time_range[0] is not None else start
+            end = self.time_range[1] if self.time_range[1] is not None else end
+        width = (end - start) / buckets or 1.0
+
+        rows = {f.name: i for i, f in enumerate(hot)}
+        counters = array('d', bytes(8 * buckets * len(hot)))
+        last = buckets - 1
+        for result in selected:
+            # Map this thread's call tree function ids to output rows.
+            row_of = [rows.get(name, -1) for name in result.call_tree.names]
+            for t, fid, weight in zip(*result.series):
+                row = row_of[fid]
+                if row >= 0:
+                    bucket = min(int((t - start) / width), last)
+                    counters[row * buckets + bucket] += weight
 
-        for root in roots[:5]:
-            print_tree(root, 0, "")
-            print()
+        return {
+            "start_ms": start,
+            "end_ms": end,
+            "bucket_ms": width,
+            "buckets": buckets,
+            "functions": [
+                {
+                    "name": f.name,
+                    "library": f.library,
+                    "self_samples": f.self_samples,
+                    "buckets": list(counters[i * buckets:(i + 1) * buckets]),
+                }
+                for i, f in enumerate(hot)
+            ],
+        }
+
+    def print_timeline(self, buckets: int = 40, top_n: int = 10,
+                       lib_filter: Optional[str] = None):
+        """Print a sparkline of self time over the capture for hot functions."""
+        timeline = self.get_timeline(buckets, top_n, lib_filter)
+        print(f"\n{'='*70}")
+        print(f"TIMELINE ({buckets} buckets of {timeline['bucket_ms'] / 1000:.3f}s, "
+              f"{format_window((timeline['start_ms'], timeline['end_ms']))})")
+        print(f"{'='*70}")
+        print(f"{'Self%':>6} {'Peak':>9}  {'Self time per bucket':<{buckets}}  Function")
+        print(f"{'-'*70}")
+        for func in timeline["functions"]:
+            counts = func["buckets"]
+            peak = max(counts, default=0)
+            peak_at = timeline["start_ms"] + counts.index(peak) * timeline["bucket_ms"] if peak else 0
+            self_pct = (func["self_samples"] / self.total_samples * 100) if self.total_samples else 0
+            print(f"{self_pct:>5.1f}% {peak_at / 1000:>8.2f}s  {sparkline(counts)}  "
+                  f"{shorten_name(func['name'], 50)}")
+
+    def write_folded(self, out: TextIO, lib_filter: Optional[str] = None,
+                     by_thread: bool = False) -> int:
+        """Write collapsed stacks ("root;...;leaf count") for flame graph tools.
+
+        Lines come from a depth-first walk of the call tree, whose nodes are
+        already memoized per stack path, so output is streamed with only the
+        current path held in memory. With lib_filter, only stacks with at
+        least one frame in a matching library are written; with by_thread,
+        each thread is written separately under its name as the root frame.
+        Returns the number of lines written.
+        """
+        self._require_call_trees()
+        trees = ([(r.name, r.call_tree) for r in self.selected_results()]
+                 if by_thread else [(None, self.call_tree)])
+
+        lines = 0
+        for thread_name, tree in trees:
+            for stack, count in self._folded_stacks(tree, lib_filter, thread_name):
+                out.write(f"{stack} {format_count(count)}\n")
+                lines += 1
+        return lines
+
+    def _folded_stacks(self, tree: CallTree, lib_filter: Optional[str] = None,
+                       root: Optional[str] = None) -> Iterator[tuple[str, float]]:
+        """(stack, self count) for each call path of tree with self time, in
+        depth-first order, optionally under a root frame."""
+        libs = dict(zip(self.functions.names, self.functions.libraries))
+        needle = lib_filter.lower() if lib_filter else None
+        names = [name.replace(';', ':') for name in tree.names]
+        in_lib = [needle is None or needle in libs.get(name, "unknown").lower()
+                  for name in tree.names]
+        path = [root.replace(';', ':')] if root is not None else []
+        lib_hits = 0
+        pending = [(child, False) for child in reversed(tree.children(tree.ROOT))]
+        while pending:
+            node, leaving = pending.pop()
+            fid = tree.func[node]
+            if leaving:
+                path.pop()
+                lib_hits -= in_lib[fid]
+                continue
+            path.append(names[fid])
+            lib_hits += in_lib[fid]
+            count = tree.self_samples[node]
+            if count and lib_hits:
+                yield ';'.join(path), count
+            pending.append((node, True))
+            pending.extend((child, False) for child in reversed(tree.children(node)))
 
     def to_json(self) -> dict:
         """Export analysis as JSON."""
         return {
             "total_samples": self.total_samples,
+            "weighting": self.weighting,
             "libraries": self.get_library_breakdown(),
             "functions": [
                 {
@@ -381,55 +2744,965 @@ class ProfileAnalyzer:
                     "self_pct": round(f.self_samples / self.total_samples * 100, 2) if self.total_samples else 0,
                     "total_pct": round(f.total_samples / self.total_samples * 100, 2) if self.total_samples else 0,
                 }
-                for f in sorted(self.functions.values(), key=lambda x: x.self_samples, reverse=True)[:100]
-            ]
+                for f in self.get_hot_functions(by="self", top_n=100)
+            ],
+            **({
+                "lines": self.get_hot_locations("line", top_n=100),
+                "addresses": self.get_hot_locations("address", top_n=100),
+            } if self.locations else {}),
         }
 
+    def export_tables(self, profile: str, source: str,
+                      stacks: bool = False) -> Iterator[tuple[str, Iterator[tuple]]]:
+        """(table, rows) for every table in EXPORT_TABLES, untruncated.
+
+        Rows are generated lazily from the column arrays, so a writer can
+        stream them out in batches. Thread rows and per-thread counts cover
+        the selected threads, numbered by their position in the profile.
+        """
+        functions = self.functions
+        names = functions.names
+        time_from, time_to = self.time_range or (None, None)
+        selected = {id(result) for result in self.selected_results()}
+        threads = [(index, result) for index, result in enumerate(self.thread_results)
+                   if id(result) in selected]
+
+        yield 'profiles', iter([(profile, source, self.total_samples, self.weight, time_from,
+                                 time_to, self.inline, self.thread_filter,
+                                 time.strftime('%Y-%m-%dT%H:%M:%S'))])
+        yield 'threads', ((profile, index, result.name, result.total_samples, len(result.functions))
+                          for index, result in threads)
+        yield 'libraries', ((profile, library, stats['self'], stats['total'], stats['functions'])
+                            for library, stats in self.get_library_breakdown().items())
+        yield 'functions', ((profile, name, library, own, total) for name, library, own, total in
+                            zip(names, functions.libraries, functions.self_samples,
+                                functions.total_samples))
+        yield 'edges', ((profile, names[key >> 32], names[key & EDGE_MASK], weight)
+                        for key, weight in zip(functions.edge_keys, functions.edge_weights))
+        yield 'thread_functions', ((profile, index, name, own, total)
+                                   for index, result in threads
+                                   for name, own, total in zip(result.functions.names,
+                                                               result.functions.self_samples,
+                                                               result.functions.total_samples))
+        if self.locations:
+            lines, addresses = self.lines, self.addresses
+            yield 'lines', ((profile, names[fid], file, line, own, total)
+                            for fid, file, line, own, total in
+                            zip(lines.fids, lines.files, lines.positions,
+                                lines.self_samples, lines.total_samples))
+            yield 'addresses', ((profile, names[fid], address, own, total)
+                                for fid, address, own, total in
+                                zip(addresses.fids, addresses.positions,
+                                    addresses.self_samples, addresses.total_samples))
+        if stacks:
+            self._require_call_trees()
+            yield 'stacks', ((profile, index, stack, count) for index, result in threads
+                             for stack, count in self._folded_stacks(result.call_tree))
+
+
+# Bump whenever aggregation changes so stale cache entries are not reused.
+ANALYZER_VERSION = 13
+
+
+def _pack_result(result: ThreadResult) -> tuple:
+    """Flatten a ThreadResult to builtins so cache entries do not depend on
+    where this module was imported from."""
+    locations = None
+    if result.lines is not None:
+        locations = (result.lines.pack(), result.addresses.pack())
+    call_tree = result.call_tree.pack() if result.call_tree is not None else None
+    return (result.name, result.total_samples, result.weight_squares, result.weighting,
+            result.functions.pack(),
+            call_tree, result.series, locations)
+
+
+def _unpack_result(packed: tuple) -> ThreadResult:
+    name, total_samples, weight_squares, weighting, functions, call_tree, series, locations = packed
+    lines, addresses = locations or (None, None)
+    return ThreadResult(name=name, total_samples=total_samples, weight_squares=weight_squares,
+                        weighting=weighting,
+                        functions=FunctionTable.unpack(functions),
+                        call_tree=CallTree.unpack(call_tree), series=series,
+                        lines=LocationTable.unpack(lines),
+                        addresses=LocationTable.unpack(addresses))
+
+
+def profile_fingerprint(path: Path, sample_bytes: int = 1 << 20) -> str:
+    """Digest of a profile file's size and its first and last sample_bytes."""
+    size = path.stat().st_size
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{size}:".encode())
+    with open(path, 'rb') as f:
+        digest.update(f.read(sample_bytes))
+        if size > sample_bytes:
+            f.seek(-sample_bytes, os.SEEK_END)
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def profile_digest(path: Path, chunk_bytes: int = 1 << 20) -> str:
+    """Digest of a profile file's entire contents, as stored on disk."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_bytes), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class AnalysisCache:
+    """On-disk cache of per-thread analysis results.
+
+    Entries are keyed by the analyzer version and result-changing options
+    plus the profile's size, mtime and a digest of its first and last
+    megabyte, so repeat runs with different display options skip loading
+    and aggregation entirely. The directory is kept under max_bytes by
+    evicting least recently used entries.
+    """
+
+    FINGERPRINT_BYTES = 1 << 20
+
+    def __init__(self, directory: Path, max_bytes: int, variant: str = ""):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # Analysis options that change aggregated results, e.g. weighting.
+        self.variant = variant
+
+    @staticmethod
+    def default_dir() -> Path:
+        base = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+        return Path(base) / 'analyze_profile'
+
+    def key(self, path: Path) -> str:
+        stat = path.stat()
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{ANALYZER_VERSION}:{self.variant}:{stat.st_mtime_ns}:".encode())
+        digest.update(profile_fingerprint(path, self.FINGERPRINT_BYTES).encode())
+        return digest.hexdigest()
+
+    def _entry(self, path: Path) -> Path:
+        return self.directory / f"{self.key(path)}.pickle"
+
+    def load(self, path: Path) -> Optional[dict]:
+        """Return the cached payload for a profile, or None on a miss."""
+        entry = self._entry(path)
+        try:
+            with open(entry, 'rb') as f:
+                payload = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Truncated or incompatible entry: drop it and recompute.
+            entry.unlink(missing_ok=True)
+            return None
+        os.utime(entry)  # mark as recently used
+        return payload
+
+    def store(self, path: Path, payload: dict):
+        """Write a payload atomically, then evict old entries."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entry = self._entry(path)
+        tmp = entry.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, 'wb') as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, entry)
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in self.directory.glob('*.pickle'):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            total -= size
+
+
+# Per-process analyzer used by --jobs workers; holds only the library table.
+_worker_analyzer: Optional[ProfileAnalyzer] = None
+
+
+def _init_worker(libs: list, options: dict):
+    global _worker_analyzer
+    _worker_analyzer = ProfileAnalyzer({'libs': libs}, **options)
+
+
+def _analyze_in_worker(thread: dict) -> ThreadResult:
+    try:
+        return _worker_analyzer._analyze_thread(thread)
+    finally:
+        _worker_analyzer._frame_tables.clear()
+
+
+def _analyze_in_pool(threads: Iterable[dict], libs: list, jobs: int,
+                     options: dict) -> Iterator[ThreadResult]:
+    """Analyze threads in worker processes, yielding results in input order.
+
+    At most 2 * jobs threads are in flight, so a streamed profile still only
+    holds a bounded number of threads in memory.
+    """
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                             initargs=(libs, options)) as pool:
+        pending: deque = deque()
+        for thread in threads:
+            pending.append(pool.submit(_analyze_in_worker, thread))
+            del thread
+            if len(pending) >= 2 * jobs:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def proportion_tests(before: array, before_total: float, after: array, after_total: float,
+                     alpha: float) -> tuple[list, list, list, list]:
+    """Two-proportion z-tests of after vs before for whole columns of counts.
+
+    Returns (diff, ci, z, p) columns in percentage points: the change in
+    share of the profile, the half-width of its (1 - alpha) confidence
+    interval, the pooled z score and its two-sided p-value. Counts and
+    totals are in independent samples; weighted counts must be rescaled to
+    effective samples first.
+    """
+    nb, na = before_total or 1, after_total or 1
+    scale = 1 / nb + 1 / na
+    crit = NormalDist().inv_cdf(1 - alpha / 2)
+    pb = [x / nb for x in before]
+    pa = [x / na for x in after]
+    pooled = [(x + y) / (nb + na) for x, y in zip(before, after)]
+    se_pooled = [math.sqrt(p * (1 - p) * scale) for p in pooled]
+    se = [math.sqrt(b * (1 - b) / nb + a * (1 - a) / na) for b, a in zip(pb, pa)]
+    diff = [(a - b) * 100 for b, a in zip(pb, pa)]
+    z = [(a - b) / s if s else 0.0 for b, a, s in zip(pb, pa, se_pooled)]
+    p = [math.erfc(abs(v) / math.sqrt(2)) for v in z]
+    ci = [crit * v * 100 for v in se]
+    return diff, ci, z, p
+
+
+def diff_profiles(before: ProfileAnalyzer, after: ProfileAnalyzer, alpha: float = 0.05) -> list[dict]:
+    """Self and total time changes for every function, most significant first.
+
+    Each function's share of the profile is compared with a two-proportion
+    z-test, treating every sample as an independent draw. Weighted profiles
+    are tested at their effective sample size, not at their weight sum,
+    which would count a 5 ms CPU delta as thousands of samples. Both columns are
+    tested over the union of functions at once and the p-values are
+    Bonferroni-adjusted for the number of tests, so on a small profile a
+    large percentage swing is only flagged when the sample counts back it up.
+    """
+    names = list(before.functions.keys() | after.functions.keys())
+    nb, na = before.effective_samples, after.effective_samples
+    scale_b = nb / (before.total_samples or 1)
+    scale_a = na / (after.total_samples or 1)
+    columns = {}
+    for kind in ("self", "total"):
+        attr = f"{kind}_samples"
+        b = array('d', (getattr(before.functions[n], attr) if n in before.functions else 0 for n in names))
+        a = array('d', (getattr(after.functions[n], attr) if n in after.functions else 0 for n in names))
+        tests = proportion_tests(array('d', (x * scale_b for x in b)), nb,
+                                 array('d', (x * scale_a for x in a)), na, alpha)
+        columns[kind] = (b, a, *tests)
+
+    tests = 2 * len(names)
+    changes = []
+    for kind, (b, a, diff, ci, z, p) in columns.items():
+        for i, name in enumerate(names):
+            p_adj = min(1.0, p[i] * tests)
+            changes.append({
+                "name": name,
+                "kind": kind,
+                "before_pct": b[i] / (before.total_samples or 1) * 100,
+                "after_pct": a[i] / (after.total_samples or 1) * 100,
+                "diff_pct": diff[i],
+                "ci_pct": ci[i],
+                "z": z[i],
+                "p_value": p_adj,
+                "significant": p_adj < alpha,
+            })
+    changes.sort(key=lambda c: abs(c["z"]), reverse=True)
+    return changes
+
+
+def compare_profiles(before: ProfileAnalyzer, after: ProfileAnalyzer, top_n: int = 20,
+                     alpha: float = 0.05) -> int:
+    """Compare two profiles and show significant differences.
+
+    Returns the number of significant regressions.
+    """
+    changes = diff_profiles(before, after, alpha)
+    significant = [c for c in changes if c["significant"]]
 
-def compare_profiles(before: ProfileAnalyzer, after: ProfileAnalyzer, top_n: int = 20):
-    """Compare two profiles and show differences."""
     print(f"\n{'='*70}")
     print(f"PROFILE COMPARISON")
     print(f"{'='*70}")
-    print(f"Before: {before.total_samples:,} samples")
-    print(f"After:  {after.total_samples:,} samples")
-
-    # Normalize to percentages for comparison
-    def get_pct(analyzer: ProfileAnalyzer) -> dict[str, float]:
-        total = analyzer.total_samples or 1
-        return {name: (f.self_samples / total * 100) for name, f in analyzer.functions.items()}
+    for label, analyzer in (("Before", before), ("After", after)):
+        line = f"{label + ':':<7} {analyzer.total_samples:,} samples"
+        if analyzer.weight_squares != analyzer.total_samples:
+            line += f" (weighted; {analyzer.effective_samples:,.0f} effective)"
+        print(line)
 
-    before_pct = get_pct(before)
-    after_pct = get_pct(after)
+    print(f"\n{'='*70}")
+    print(f"SIGNIFICANT CHANGES (two-proportion z-test, Bonferroni-adjusted p < {alpha:g})")
+    print(f"{'='*70}")
+    print(f"{'Before%':>8} {'After%':>8} {'Diff':>8} {'±CI':>6} {'p':>8}  {'Time':<5}  {'Function'}")
+    print(f"{'-'*70}")
 
-    all_funcs = set(before_pct.keys()) | set(after_pct.keys())
+    for c in significant[:top_n]:
+        print(f"{c['before_pct']:>7.1f}% {c['after_pct']:>7.1f}% {c['diff_pct']:>+7.1f}% "
+              f"{c['ci_pct']:>5.1f}% {c['p_value']:>8.1e}  {c['kind']:<5}  {shorten_name(c['name'], 40)}")
+    if not significant:
+        print("No significant changes.")
 
-    diffs = []
-    for name in all_funcs:
-        b = before_pct.get(name, 0)
-        a = after_pct.get(name, 0)
-        diff = a - b
-        if abs(diff) >= 0.1:  # At least 0.1% change
-            diffs.append((name, b, a, diff))
+    # Summary
+    improved = sum(1 for c in significant if c["kind"] == "self" and c["diff_pct"] < 0)
+    regressed = sum(1 for c in significant if c["kind"] == "self" and c["diff_pct"] > 0)
+    print(f"\nSummary: {improved} functions improved, {regressed} regressed "
+          f"(significant self time change)")
+    return regressed
+
+
+class ProfileSet:
+    """Several runs of the same workload aggregated into one analyzer.
+
+    Profiles are folded in one at a time: thread results with the same
+    name are summed, and each function keeps running sums of its per-run
+    self and total share (and their squares) for the mean and variance
+    across runs. Memory is bounded by the distinct threads and functions,
+    not by the number of profiles. A set of one run has no run-to-run
+    variance; its shares fall back to their sampling variance at the run's
+    effective sample size.
+    """
+
+    def __init__(self, options: dict, names: Optional[dict[str, str]] = None):
+        self.analyzer = ProfileAnalyzer({'libs': []}, names=names, **options)
+        self.count = 0
+        # Effective sample size of the first run, for a set of one.
+        self.first_samples = 0.0
+        # name -> [sum self%, sum self%^2, sum total%, sum total%^2]
+        self.moments: dict[str, list[float]] = {}
+        self._threads: dict[str, ThreadResult] = {}
+
+    def add(self, analyzer: ProfileAnalyzer):
+        """Fold one analyzed profile into the set."""
+        if not self.count:
+            # Runs of one workload load the same libraries; report the first's.
+            self.analyzer.libs_by_index = analyzer.libs_by_index
+            self.analyzer.lib_index = analyzer.lib_index
+            self.first_samples = analyzer.effective_samples
+        self.count += 1
+        total = analyzer.total_samples or 1
+        moments = self.moments
+        for name, stats in analyzer.functions.items():
+            m = moments.get(name)
+            if m is None:
+                m = moments[name] = [0.0, 0.0, 0.0, 0.0]
+            self_pct = stats.self_samples / total * 100
+            total_pct = stats.total_samples / total * 100
+            m[0] += self_pct
+            m[1] += self_pct * self_pct
+            m[2] += total_pct
+            m[3] += total_pct * total_pct
+        for result in analyzer.thread_results:
+            mine = self._threads.get(result.name)
+            if mine is None:
+                # Same-named threads are summed into a result of our own, so
+                # the analyzer passed in is never modified.
+                with_locations = result.lines is not None
+                mine = self._threads[result.name] = ThreadResult(
+                    name=result.name,
+                    call_tree=CallTree() if result.call_tree is not None else None,
+                    lines=LocationTable() if with_locations else None,
+                    addresses=LocationTable() if with_locations else None)
+                self.analyzer.thread_results.append(mine)
+            mine.merge(result)
+
+    def mean_var(self, name: str, kind: str) -> tuple[float, float]:
+        """Mean and sample variance of a function's self or total % per run.
+
+        Runs where the function never appeared count as 0%. For a single run
+        the variance is the binomial p(1 - p) / n at its effective size.
+        """
+        m = self.moments.get(name)
+        if m is None:
+            return 0.0, 0.0
+        total, squares = (m[0], m[1]) if kind == "self" else (m[2], m[3])
+        n = self.count
+        mean = total / n
+        if n > 1:
+            return mean, max(0.0, (squares - total * mean) / (n - 1))
+        if not self.first_samples:
+            return mean, 0.0
+        return mean, mean * (100 - mean) / self.first_samples
+
+
+def _betainc(a: float, b: float, x: float) -> float:
+    """Regularized incomplete beta function I_x(a, b) (Lentz continued fraction)."""
+    if x <= 0:
+        return 0.0
+    if x >= 1:
+        return 1.0
+    if x > (a + 1) / (a + b + 2):
+        return 1.0 - _betainc(b, a, 1.0 - x)
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b)
+                     + a * math.log(x) + b * math.log1p(-x)) / a
+    tiny = 1e-300
+    c, d = 1.0, 1.0 - (a + b) * x / (a + 1)
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    f = d
+    for m in range(1, 200):
+        for numerator in (m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)),
+                          -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1))):
+            d = 1.0 + numerator * d
+            d = 1.0 / (d if abs(d) > tiny else tiny)
+            c = 1.0 + numerator / c
+            c = c if abs(c) > tiny else tiny
+            f *= c * d
+        if abs(c * d - 1.0) < 1e-12:
+            break
+    return front * f
+
+
+def welch_tests(mean_a: list, var_a: list, n_a: int, mean_b: list, var_b: list,
+                n_b: int) -> tuple[list, list]:
+    """Welch's t-test of mean_b vs mean_a for whole columns of per-run stats.
+
+    Returns (t, p) columns; p is two-sided from Student's t distribution
+    with Welch-Satterthwaite degrees of freedom. A side of one run adds
+    no degrees of freedom to the denominator (its variance is a sampling
+    variance), and with one run on both sides the test is a normal z-test.
+    Where both variances are zero there is no evidence either way: t is 0
+    and p is 1, however far apart the means are.
+    """
+    ea = [v / n_a for v in var_a]
+    eb = [v / n_b for v in var_b]
+    t_col, p_col = [], []
+    for ma, mb, xa, xb in zip(mean_a, mean_b, ea, eb):
+        se = math.sqrt(xa + xb)
+        if not se:
+            t_col.append(0.0)
+            p_col.append(1.0)
+            continue
+        denom = (xa * xa / (n_a - 1) if n_a > 1 else 0) + (xb * xb / (n_b - 1) if n_b > 1 else 0)
+        t = (mb - ma) / se
+        t_col.append(t)
+        if not denom:
+            p_col.append(math.erfc(abs(t) / math.sqrt(2)))
+            continue
+        df = (xa + xb) ** 2 / denom
+        p_col.append(_betainc(df / 2, 0.5, df / (df + t * t)))
+    return t_col, p_col
+
+
+def diff_profile_sets(before: ProfileSet, after: ProfileSet, alpha: float = 0.05) -> list[dict]:
+    """Self and total time changes between two sets of runs, most significant first.
+
+    Each function's per-run share is compared with Welch's t-test, so the
+    run-to-run noise measured in each set decides what counts as a change.
+    p-values are Bonferroni-adjusted as in diff_profiles().
+    """
+    names = list(before.moments.keys() | after.moments.keys())
+    tests = 2 * len(names)
+    changes = []
+    for kind in ("self", "total"):
+        mean_a, var_a = zip(*(before.mean_var(n, kind) for n in names)) if names else ((), ())
+        mean_b, var_b = zip(*(after.mean_var(n, kind) for n in names)) if names else ((), ())
+        t, p = welch_tests(mean_a, var_a, before.count, mean_b, var_b, after.count)
+        for i, name in enumerate(names):
+            p_adj = min(1.0, p[i] * tests)
+            changes.append({
+                "name": name,
+                "kind": kind,
+                "before_pct": mean_a[i],
+                "before_sd_pct": math.sqrt(var_a[i]),
+                "after_pct": mean_b[i],
+                "after_sd_pct": math.sqrt(var_b[i]),
+                "diff_pct": mean_b[i] - mean_a[i],
+                "t": t[i],
+                "p_value": p_adj,
+                "significant": p_adj < alpha,
+            })
+    changes.sort(key=lambda c: abs(c["t"]), reverse=True)
+    return changes
+
+
+def compare_profile_sets(before: ProfileSet, after: ProfileSet, top_n: int = 20,
+                         alpha: float = 0.05) -> int:
+    """Compare two sets of runs and show significant differences.
+
+    Returns the number of significant regressions.
+    """
+    changes = diff_profile_sets(before, after, alpha)
+    significant = [c for c in changes if c["significant"]]
 
-    # Sort by absolute diff
-    diffs.sort(key=lambda x: abs(x[3]), reverse=True)
+    print(f"\n{'='*70}")
+    print(f"PROFILE SET COMPARISON")
+    print(f"{'='*70}")
+    print(f"Before: {before.count} profiles, {before.analyzer.total_samples:,} samples")
+    print(f"After:  {after.count} profiles, {after.analyzer.total_samples:,} samples")
 
     print(f"\n{'='*70}")
-    print(f"BIGGEST CHANGES (by self time %)")
+    print(f"SIGNIFICANT CHANGES (Welch t-test over runs, Bonferroni-adjusted p < {alpha:g})")
     print(f"{'='*70}")
-    print(f"{'Before%':>8} {'After%':>8} {'Diff':>8}  {'Function'}")
+    print(f"{'Before% ±sd':>13} {'After% ±sd':>13} {'Diff':>8} {'p':>8}  {'Time':<5}  {'Function'}")
     print(f"{'-'*70}")
 
-    for name, b, a, diff in diffs[:top_n]:
-        sign = "+" if diff > 0 else ""
-        color = ""
-        print(f"{b:>7.1f}% {a:>7.1f}% {sign}{diff:>7.1f}%  {shorten_name(name, 50)}")
+    for c in significant[:top_n]:
+        print(f"{c['before_pct']:>6.1f}% ±{c['before_sd_pct']:<4.1f} {c['after_pct']:>6.1f}% "
+              f"±{c['after_sd_pct']:<4.1f} {c['diff_pct']:>+7.1f}% {c['p_value']:>8.1e}  "
+              f"{c['kind']:<5}  {shorten_name(c['name'], 40)}")
+    if not significant:
+        print("No significant changes.")
+
+    improved = sum(1 for c in significant if c["kind"] == "self" and c["diff_pct"] < 0)
+    regressed = sum(1 for c in significant if c["kind"] == "self" and c["diff_pct"] > 0)
+    print(f"\nSummary: {improved} functions improved, {regressed} regressed "
+          f"(significant self time change)")
+    return regressed
+
+
+# Exported tables and their columns. Rows of every table carry `profile`, a
+# digest of the whole profile file (profile_digest), and functions appear by
+# demangled name, so exports of many captures can be joined on those columns
+# directly.
+EXPORT_TABLES = {
+    'profiles': (('profile', 'TEXT'), ('path', 'TEXT'), ('total_samples', 'REAL'),
+                 ('weight', 'TEXT'), ('time_from_ms', 'REAL'), ('time_to_ms', 'REAL'),
+                 ('inline', 'TEXT'), ('thread_filter', 'TEXT'), ('exported_at', 'TEXT')),
+    'threads': (('profile', 'TEXT'), ('thread_index', 'INTEGER'), ('thread', 'TEXT'),
+                ('samples', 'REAL'), ('functions', 'INTEGER')),
+    'libraries': (('profile', 'TEXT'), ('library', 'TEXT'), ('self_samples', 'REAL'),
+                  ('total_samples', 'REAL'), ('functions', 'INTEGER')),
+    'functions': (('profile', 'TEXT'), ('function', 'TEXT'), ('library', 'TEXT'),
+                  ('self_samples', 'REAL'), ('total_samples', 'REAL')),
+    'edges': (('profile', 'TEXT'), ('caller', 'TEXT'), ('callee', 'TEXT'), ('samples', 'REAL')),
+    'thread_functions': (('profile', 'TEXT'), ('thread_index', 'INTEGER'), ('function', 'TEXT'),
+                         ('self_samples', 'REAL'), ('total_samples', 'REAL')),
+    'lines': (('profile', 'TEXT'), ('function', 'TEXT'), ('file', 'TEXT'), ('line', 'INTEGER'),
+              ('self_samples', 'REAL'), ('total_samples', 'REAL')),
+    'addresses': (('profile', 'TEXT'), ('function', 'TEXT'), ('address', 'INTEGER'),
+                  ('self_samples', 'REAL'), ('total_samples', 'REAL')),
+    'stacks': (('profile', 'TEXT'), ('thread_index', 'INTEGER'), ('stack', 'TEXT'),
+               ('samples', 'REAL')),
+}
+EXPORT_INDEXES = (('profiles', 'profile'), ('threads', 'profile'), ('libraries', 'profile'),
+                  ('functions', 'profile'), ('functions', 'function'), ('edges', 'profile'),
+                  ('edges', 'caller'), ('edges', 'callee'), ('thread_functions', 'profile'),
+                  ('thread_functions', 'function'), ('lines', 'profile'), ('lines', 'function'),
+                  ('addresses', 'profile'), ('addresses', 'function'), ('stacks', 'profile'))
+EXPORT_BATCH_ROWS = 10_000
+
+
+def _batches(rows: Iterable[tuple], size: int = EXPORT_BATCH_ROWS) -> Iterator[list[tuple]]:
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+class SqliteExport:
+    """Analysis tables appended to a SQLite database, one profile at a time.
+
+    Tables and indexes are created on first use. Each profile is written in
+    one transaction, batch by batch, replacing any earlier export of it.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        for table, columns in EXPORT_TABLES.items():
+            self.db.execute(f"CREATE TABLE IF NOT EXISTS {table} "
+                            f"({', '.join(f'{name} {kind}' for name, kind in columns)})")
+        for table, column in EXPORT_INDEXES:
+            self.db.execute(f"CREATE INDEX IF NOT EXISTS {table}_{column} ON {table} ({column})")
+
+    def write(self, profile: str, tables: Iterable[tuple[str, Iterable[tuple]]]) -> int:
+        """Write one profile's tables; returns the number of rows written."""
+        written = 0
+        with self.db:
+            for table in EXPORT_TABLES:
+                self.db.execute(f"DELETE FROM {table} WHERE profile = ?", (profile,))
+            for table, rows in tables:
+                sql = (f"INSERT INTO {table} VALUES "
+                       f"({', '.join('?' * len(EXPORT_TABLES[table]))})")
+                for batch in _batches(rows):
+                    self.db.executemany(sql, batch)
+                    written += len(batch)
+        return written
+
+    def close(self):
+        self.db.close()
+
+
+class ParquetExport:
+    """Analysis tables written as Parquet files, <dir>/<table>/<profile>.parquet.
+
+    Each table directory reads as one dataset across profiles (e.g. with
+    pyarrow.dataset or DuckDB's read_parquet('dir/functions/*.parquet')).
+    Rows are converted and written a batch at a time. Needs pyarrow.
+    """
+
+    TYPES = {'TEXT': 'string', 'REAL': 'float64', 'INTEGER': 'int64'}
+
+    def __init__(self, directory: Path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet export needs 'pyarrow' (pip install pyarrow); "
+                               "export to a .db file for SQLite instead") from None
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.path = directory
+        self.schemas = {table: pyarrow.schema([(name, self.TYPES[kind]) for name, kind in columns])
+                        for table, columns in EXPORT_TABLES.items()}
+
+    def write(self, profile: str, tables: Iterable[tuple[str, Iterable[tuple]]]) -> int:
+        """Write one profile's tables; returns the number of rows written."""
+        pa = self.pa
+        written = 0
+        for table, rows in tables:
+            schema = self.schemas[table]
+            target = self.path / table
+            target.mkdir(parents=True, exist_ok=True)
+            with self.pq.ParquetWriter(target / f"{profile}.parquet", schema) as writer:
+                for batch in _batches(rows):
+                    columns = [pa.array(column, type=f.type)
+                               for column, f in zip(zip(*batch), schema)]
+                    writer.write_batch(pa.record_batch(columns, schema=schema))
+                    written += len(batch)
+        return written
+
+    def close(self):
+        pass
+
+
+def export_profiles(paths: list[Path], args: argparse.Namespace):
+    """Analyze each profile on its own and export its full tables.
+
+    Profiles are loaded one at a time (through the analysis cache), so any
+    number of captures can go into one database or Parquet directory.
+    """
+    target = Path(args.export)
+    exporter = ParquetExport(target) if target.suffix == '.parquet' else SqliteExport(target)
+    try:
+        for path in paths:
+            analyzer = load_analyzer(path, args)
+            profile = profile_digest(path)
+            start = time.perf_counter()
+            rows = exporter.write(profile, analyzer.export_tables(
+                profile, str(path), stacks=args.export_stacks))
+            elapsed = time.perf_counter() - start
+            print(f"Exported {rows:,} rows of {path} to {target} ({elapsed:.1f} s)", file=sys.stderr)
+    finally:
+        exporter.close()
+
+
+def analysis_options(args: argparse.Namespace) -> dict:
+    """ProfileAnalyzer options taken from the command line."""
+    time_range = None
+    if args.time_from is not None or args.time_to is not None:
+        time_range = (None if args.time_from is None else args.time_from * 1000,
+                      None if args.time_to is None else args.time_to * 1000)
+    return {'weight': args.weight, 'time_range': time_range, 'timeline': bool(args.timeline),
+            'locations': (args.lines is not None or args.addresses is not None
+                          or args.export is not None),
+            'inline': args.inline,
+            'call_trees': bool(args.tree or args.inverted or args.folded or args.crates
+                               or args.timeline or args.export_stacks or args.interactive)}
+
+
+def load_analyzer(path: Path, args: argparse.Namespace,
+                  names: Optional[dict[str, str]] = None) -> ProfileAnalyzer:
+    """Load and analyze a profile according to the command-line options.
+
+    Only the threads selected by --thread are analyzed, and the result is
+    cached under that filter. A cached analysis of every thread serves any
+    filter as well, so it is tried next.
+    """
+    options = analysis_options(args)
+    cache = None
+    if not args.no_cache:
+        directory = args.cache_dir or AnalysisCache.default_dir()
+        max_bytes = int(args.cache_size * 2**20)
+        variant = repr(sorted(options.items()))
+        caches = [AnalysisCache(directory, max_bytes, variant=variant)]
+        if args.thread:
+            caches.insert(0, AnalysisCache(directory, max_bytes,
+                                           variant=f"{variant}:thread={args.thread!r}"))
+        # A miss is stored under the most specific variant.
+        cache = caches[0]
+        start = time.perf_counter()
+        for candidate in caches:
+            payload = candidate.load(path)
+            if payload is not None:
+                analyzer = _unpack_analyzer(payload, options, args.thread, names)
+                elapsed = (time.perf_counter() - start) * 1000
+                print(f"Loaded cached analysis of {path} ({elapsed:.0f} ms)", file=sys.stderr)
+                _warn_unweighted(analyzer, path)
+                return analyzer
 
-    # Summary
-    improved = sum(1 for _, _, _, d in diffs if d < -0.5)
-    regressed = sum(1 for _, _, _, d in diffs if d > 0.5)
-    print(f"\nSummary: {improved} functions improved, {regressed} regressed (>0.5% change)")
+    print(f"Loading {path}...", file=sys.stderr)
+    try:
+        f = open_profile(path)
+    except RuntimeError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    with f:
+        data = stream_profile(f) if args.stream else json.load(f)
+        analyzer = ProfileAnalyzer(data, names=names, **options)
+        analyzer.analyze(thread_filter=args.thread, jobs=args.jobs)
+        libs = data.get('libs', [])
+
+    if cache is not None:
+        cache.store(path, {'libs': libs,
+                           'thread_results': [_pack_result(r) for r in analyzer.thread_results]})
+
+    if args.stream:
+        peak = peak_rss()
+        if peak is not None:
+            size = path.stat().st_size
+            print(f"Peak RSS: {peak / 2**20:,.0f} MiB for a {size / 2**20:,.0f} MiB profile",
+                  file=sys.stderr)
+    _warn_unweighted(analyzer, path)
+    return analyzer
+
+
+def _warn_unweighted(analyzer: ProfileAnalyzer, path: Path):
+    """Report threads the requested --weight column could not weight."""
+    missing = analyzer.unweighted_threads()
+    if missing:
+        column = 'threadCPUDelta' if analyzer.weight == "cpu" else 'weight'
+        print(f"Warning: {path}: {len(missing)} thread(s) have no samples.{column} column "
+              f"and count 1 per sample: {', '.join(missing[:5])}"
+              f"{', ...' if len(missing) > 5 else ''}", file=sys.stderr)
+
+
+def _unpack_analyzer(payload: dict, options: dict, thread_filter: Optional[str],
+                     names: Optional[dict[str, str]] = None) -> ProfileAnalyzer:
+    """Rebuild an analyzer from packed libs and thread results."""
+    analyzer = ProfileAnalyzer({'libs': payload['libs']}, names=names, **options)
+    analyzer.thread_results = [_unpack_result(r) for r in payload['thread_results']]
+    analyzer.merge_threads(thread_filter)
+    return analyzer
+
+
+def _load_in_worker(path: Path, args: argparse.Namespace) -> dict:
+    analyzer = load_analyzer(path, args)
+    return {'libs': analyzer.data.get('libs', []), 'thread_results': [_pack_result(r) for r in analyzer.thread_results]}
+
+
+def load_profile_set(paths: list[Path], args: argparse.Namespace,
+                     names: Optional[dict[str, str]] = None) -> ProfileSet:
+    """Load and fold several profiles into one ProfileSet.
+
+    With --jobs N the profiles are analyzed N at a time in worker
+    processes, at most 2 * N in flight, and folded in as they finish in
+    input order, so peak memory does not grow with the number of files.
+    """
+    options = analysis_options(args)
+    profiles = ProfileSet(options, names=names)
+    if args.jobs > 1:
+        worker_args = argparse.Namespace(**{**vars(args), 'jobs': 1})
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            pending: deque = deque()
+            for path in paths:
+                pending.append(pool.submit(_load_in_worker, path, worker_args))
+                if len(pending) >= 2 * args.jobs:
+                    profiles.add(_unpack_analyzer(pending.popleft().result(), options, args.thread))
+            while pending:
+                profiles.add(_unpack_analyzer(pending.popleft().result(), options, args.thread))
+    else:
+        for path in paths:
+            profiles.add(load_analyzer(path, args, names=profiles.analyzer.names))
+    profiles.analyzer.merge_threads(args.thread)
+    return profiles
+
+
+class ProfileShell(cmd.Cmd):
+    """Interactive queries against profiles loaded and analyzed once.
+
+    Every thread is analyzed up front, so changing the thread filter only
+    re-merges per-thread results. A time slice re-analyzes the profile (or
+    hits the cache) because windows apply while samples are counted. Each
+    command reports how long it took.
+    """
+
+    prompt = "profile> "
+    intro = "Type help for commands, quit to exit."
+
+    def __init__(self, paths: list[Path], args: argparse.Namespace):
+        super().__init__()
+        self.paths = paths
+        self.args = args
+        self.profiles: Optional[ProfileSet] = None
+        self._started = 0.0
+        self._load()
+
+    def _load(self):
+        """(Re)load the profiles with the current options."""
+        args = self.args
+        if len(self.paths) > 1:
+            # Per-run shares behind diff follow the thread filter, so reload.
+            self.profiles = load_profile_set(self.paths, args)
+            self.analyzer = self.profiles.analyzer
+        else:
+            self.analyzer = load_analyzer(self.paths[0],
+                                          argparse.Namespace(**{**vars(args), 'thread': None}))
+            self.analyzer.merge_threads(args.thread)
+
+    def precmd(self, line: str) -> str:
+        self._started = time.perf_counter()
+        return line
+
+    def postcmd(self, stop: bool, line: str) -> bool:
+        if line.strip() and not stop:
+            print(f"[{(time.perf_counter() - self._started) * 1000:.1f} ms]")
+        return stop
+
+    def emptyline(self):
+        pass
+
+    def onecmd(self, line: str) -> bool:
+        try:
+            return super().onecmd(line)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return False
+
+    def do_summary(self, arg: str):
+        """summary [N]: hot functions and library breakdown (top N)."""
+        top = int(arg) if arg.strip() else self.args.top
+        self.analyzer.print_summary(top_n=top, lib_filter=self.args.lib)
+
+    def do_callers(self, arg: str):
+        """callers NAME: callers of the functions matching NAME (see match)."""
+        self.analyzer.print_callers(arg.strip(), match=self.args.match)
+
+    def do_callees(self, arg: str):
+        """callees NAME: callees of the functions matching NAME (see match)."""
+        self.analyzer.print_callees(arg.strip(), match=self.args.match)
+
+    def do_lines(self, arg: str):
+        """lines [NAME]: hottest source lines, or within functions matching NAME."""
+        self._print_locations("line", arg)
+
+    def do_addresses(self, arg: str):
+        """addresses [NAME]: hottest instruction addresses, or within functions matching NAME."""
+        self._print_locations("address", arg)
+
+    def _print_locations(self, kind: str, arg: str):
+        if not self.analyzer.locations:
+            # Line and address counts are collected while samples are walked.
+            self.args.lines = ""
+            self._load()
+        self.analyzer.print_hot_locations(kind, top_n=self.args.top, lib_filter=self.args.lib,
+                                          func_name=arg.strip() or None, match=self.args.match)
+
+    def do_match(self, arg: str):
+        """match [substring|prefix|exact|regex]: how callers/callees match NAME."""
+        if arg.strip():
+            if arg.strip() not in MATCH_MODES:
+                raise ValueError(f"match must be one of {', '.join(MATCH_MODES)}")
+            self.args.match = arg.strip()
+        print(f"Matching by {self.args.match}")
+
+    def do_tree(self, arg: str):
+        """tree [DEPTH [MIN_PCT]]: top-down call tree."""
+        depth, min_pct = self._tree_args(arg)
+        self.analyzer.print_call_tree(max_depth=depth, min_pct=min_pct)
+
+    def do_inverted(self, arg: str):
+        """inverted [DEPTH [MIN_PCT]]: bottom-up call tree."""
+        depth, min_pct = self._tree_args(arg)
+        self.analyzer.print_inverted_tree(max_depth=depth, min_pct=min_pct)
+
+    def do_groups(self, arg: str):
+        """groups [REGEX...]: threads merged into pools by name pattern."""
+        self.analyzer.print_thread_groups(shlex.split(arg) or DEFAULT_THREAD_GROUPS)
+
+    def do_crates(self, arg: str):
+        """crates [DEPTH [MIN_PCT]]: time rolled up by crate, module and function."""
+        depth, min_pct = self._tree_args(arg)
+        self.analyzer.print_crate_rollup(max_depth=depth, min_pct=min_pct)
+
+    def _tree_args(self, arg: str) -> tuple[int, float]:
+        parts = shlex.split(arg)
+        depth = int(parts[0]) if parts else self.args.tree_depth
+        min_pct = float(parts[1]) if len(parts) > 1 else self.args.min_pct
+        return depth, min_pct
+
+    def do_filter(self, arg: str):
+        """filter [thread NAME | lib NAME | clear]: restrict to threads or a library."""
+        parts = shlex.split(arg)
+        if parts and parts[0] == "clear":
+            self.args.lib = None
+            self._set_thread(None)
+        elif len(parts) == 2 and parts[0] == "thread":
+            self._set_thread(parts[1])
+        elif len(parts) == 2 and parts[0] == "lib":
+            self.args.lib = parts[1]
+        elif parts:
+            raise ValueError("usage: filter [thread NAME | lib NAME | clear]")
+        print(f"Thread: {self.args.thread or 'all'}, library: {self.args.lib or 'all'}, "
+              f"{self.analyzer.total_samples:,} samples")
+
+    def _set_thread(self, thread: Optional[str]):
+        self.args.thread = thread
+        if self.profiles is not None:
+            self._load()
+        else:
+            self.analyzer.merge_threads(thread)
+
+    def do_slice(self, arg: str):
+        """slice [FROM TO | clear]: only count samples in this window (seconds; - for open)."""
+        parts = shlex.split(arg)
+        if parts == ["clear"]:
+            self.args.time_from = self.args.time_to = None
+        elif len(parts) == 2:
+            self.args.time_from, self.args.time_to = (None if p == "-" else float(p) for p in parts)
+        elif parts:
+            raise ValueError("usage: slice [FROM TO | clear]")
+        if parts:
+            self._load()
+        time_range = self.analyzer.time_range
+        print(f"Time window: {format_window(time_range) if time_range else 'whole profile'}")
+
+    def do_diff(self, arg: str):
+        """diff FILE...: compare the loaded profile(s) against other runs."""
+        paths = [Path(p) for p in shlex.split(arg)]
+        if not paths:
+            raise ValueError("usage: diff FILE...")
+        missing = [str(p) for p in paths if not p.exists()]
+        if missing:
+            raise ValueError(f"file not found: {', '.join(missing)}")
+        if self.profiles is not None or len(paths) > 1:
+            before = self.profiles
+            if before is None:
+                # A set of one run, folded from copies of the loaded threads.
+                before = ProfileSet(self.analyzer.options)
+                before.add(self.analyzer)
+                before.analyzer.merge_threads(self.args.thread)
+            after = load_profile_set(paths, self.args, names=self.analyzer.names)
+            compare_profile_sets(before, after, top_n=self.args.top, alpha=self.args.alpha)
+        else:
+            after = load_analyzer(paths[0], self.args, names=self.analyzer.names)
+            compare_profiles(self.analyzer, after, top_n=self.args.top, alpha=self.args.alpha)
+
+    def do_quit(self, arg: str) -> bool:
+        """quit: leave the shell."""
+        return True
+
+    do_exit = do_quit
+
+    def do_EOF(self, arg: str) -> bool:
+        print()
+        return True
 
 
 def main():
@@ -438,64 +3711,215 @@ def main():
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog=__doc__
     )
-    parser.add_argument("profile", help="Path to profile.json")
+    parser.add_argument("profile", nargs="+",
+                        help="Path to profile.json (.gz and .zst are decompressed on the fly); "
+                             "several runs of the same workload are aggregated")
     parser.add_argument("--top", "-n", type=int, default=20, help="Number of top functions to show")
     parser.add_argument("--lib", "-l", help="Filter to functions in this library")
     parser.add_argument("--thread", "-t", help="Filter to thread name containing this string")
+    parser.add_argument("--group-threads", nargs="*", metavar="REGEX",
+                        help="Show a per-group breakdown of threads merged by name pattern; a "
+                             "pattern's capture groups name its group (default: strip a trailing "
+                             "thread number, so worker-1..N form one pool)")
     parser.add_argument("--callers", "-c", help="Show callers of function matching this name")
     parser.add_argument("--callees", help="Show callees of function matching this name")
+    parser.add_argument("--match", choices=MATCH_MODES, default="substring",
+                        help="How --callers/--callees match names: case-insensitive substring "
+                             "(default) or prefix, exact name, or regex; edges of all matches are summed")
     parser.add_argument("--tree", action="store_true", help="Show call tree")
+    parser.add_argument("--inverted", action="store_true",
+                        help="Show inverted (bottom-up) call tree: hot leaves and the paths to them")
+    parser.add_argument("--crates", action="store_true",
+                        help="Show time rolled up by crate, module path and function "
+                             "(pruned by --tree-depth and --min-pct)")
     parser.add_argument("--tree-depth", type=int, default=5, help="Max call tree depth")
     parser.add_argument("--min-pct", type=float, default=1.0, help="Minimum percentage for tree/filtering")
+    parser.add_argument("--weight", choices=WEIGHT_MODES, default="auto",
+                        help="Sample weighting: samples.weight when present (auto), 1 per sample, "
+                             "samples.weight, or threadCPUDelta CPU time (default: auto)")
+    parser.add_argument("--inline", choices=INLINE_MODES, default="expand",
+                        help="Inlined frames: report them as their own functions (expand, default) "
+                             "or fold their time into the function they were inlined into (collapse)")
+    parser.add_argument("--from", dest="time_from", type=float, metavar="SECONDS",
+                        help="Only count samples at or after this time (seconds from profile start)")
+    parser.add_argument("--to", dest="time_to", type=float, metavar="SECONDS",
+                        help="Only count samples before this time (seconds from profile start)")
+    parser.add_argument("--timeline", type=int, metavar="BUCKETS", nargs="?", const=40,
+                        help="Show per-bucket self time of the top functions over the capture "
+                             "(default: 40 buckets; combine with --json, --top, --lib)")
+    parser.add_argument("--lines", nargs="?", const="", metavar="FUNC",
+                        help="Show the hottest source lines, or where time goes within the "
+                             "functions matching FUNC (see --match)")
+    parser.add_argument("--addresses", nargs="?", const="", metavar="FUNC",
+                        help="Like --lines, per instruction address")
     parser.add_argument("--json", "-j", action="store_true", help="Output as JSON")
-    parser.add_argument("--diff", "-d", help="Compare against another profile")
+    parser.add_argument("--diff", "-d", nargs="+", metavar="FILE",
+                        help="Compare against another profile, or against a set of runs")
+    parser.add_argument("--alpha", type=float, default=0.05,
+                        help="Significance level for --diff after Bonferroni adjustment (default: 0.05)")
+    parser.add_argument("--fail-on-regression", action="store_true",
+                        help="With --diff, exit with status 2 if any function's self time "
+                             "increased significantly")
+    parser.add_argument("--folded", metavar="PATH",
+                        help="Export collapsed stacks for inferno/flamegraph.pl/speedscope ('-' for stdout)")
+    parser.add_argument("--folded-threads", action="store_true",
+                        help="With --folded, put each thread's name at the root of its stacks")
+
+    parser.add_argument("--export", metavar="PATH",
+                        help="Export complete functions, edges, libraries, threads, per-thread "
+                             "and per-line counts of each profile to a SQLite database, or to a "
+                             "directory of Parquet files if PATH ends in .parquet (needs pyarrow)")
+    parser.add_argument("--export-stacks", action="store_true",
+                        help="With --export, also export each thread's collapsed stacks")
+
+    parser.add_argument("--interactive", "-i", action="store_true",
+                        help="Load once, then answer summary/callers/callees/tree/filter/slice/diff "
+                             "commands at a prompt")
+
+    parser.add_argument("--stream", action="store_true",
+                        help="Parse threads incrementally to bound memory on very large profiles")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Analyze threads in N worker processes (default: 1)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Do not read or write the on-disk analysis cache")
+    parser.add_argument("--cache-dir", type=Path,
+                        help="Analysis cache directory (default: ~/.cache/analyze_profile)")
+    parser.add_argument("--cache-size", type=float, default=1024,
+                        help="Maximum cache size in MiB before old entries are evicted (default: 1024)")
 
     args = parser.parse_args()
 
     # Load profile
-    path = Path(args.profile)
-    if not path.exists():
-        print(f"Error: File not found: {path}", file=sys.stderr)
+    paths = [Path(p) for p in args.profile]
+    diff_paths = [Path(p) for p in args.diff or []]
+    for path in paths:
+        if not path.exists():
+            print(f"Error: File not found: {path}", file=sys.stderr)
+            sys.exit(1)
+    for path in diff_paths:
+        if not path.exists():
+            print(f"Error: Diff file not found: {path}", file=sys.stderr)
+            sys.exit(1)
+    if args.timeline and len(paths) > 1:
+        print("Error: --timeline needs a single profile", file=sys.stderr)
         sys.exit(1)
 
-    print(f"Loading {path}...", file=sys.stderr)
-    with open(path) as f:
-        data = json.load(f)
+    if args.interactive:
+        ProfileShell(paths, args).cmdloop()
+        return
+
+    if args.export:
+        try:
+            export_profiles(paths, args)
+        except RuntimeError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        return
 
-    analyzer = ProfileAnalyzer(data)
-    analyzer.analyze(thread_filter=args.thread)
+    # Several runs on either side are aggregated and compared run by run
+    runs = len(paths) > 1 or len(diff_paths) > 1
+    if runs:
+        profiles = load_profile_set(paths, args)
+        analyzer = profiles.analyzer
+    else:
+        analyzer = load_analyzer(paths[0], args)
 
     # Handle diff mode
-    if args.diff:
-        diff_path = Path(args.diff)
-        if not diff_path.exists():
-            print(f"Error: Diff file not found: {diff_path}", file=sys.stderr)
+    if diff_paths:
+        if runs:
+            before, after = profiles, load_profile_set(diff_paths, args, names=analyzer.names)
+            diff, compare = diff_profile_sets, compare_profile_sets
+        else:
+            before, after = analyzer, load_analyzer(diff_paths[0], args, names=analyzer.names)
+            diff, compare = diff_profiles, compare_profiles
+        try:
+            if args.json:
+                changes = [c for c in diff(before, after, args.alpha) if c["significant"]]
+                print(json.dumps(changes, indent=2))
+                regressed = sum(1 for c in changes if c["kind"] == "self" and c["diff_pct"] > 0)
+            else:
+                regressed = compare(before, after, top_n=args.top, alpha=args.alpha)
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
             sys.exit(1)
+        if args.fail_on_regression and regressed:
+            sys.exit(2)
+        return
 
-        print(f"Loading {diff_path}...", file=sys.stderr)
-        with open(diff_path) as f:
-            diff_data = json.load(f)
-
-        diff_analyzer = ProfileAnalyzer(diff_data)
-        diff_analyzer.analyze(thread_filter=args.thread)
-        compare_profiles(analyzer, diff_analyzer, top_n=args.top)
+    # Timeline
+    if args.timeline:
+        if args.json:
+            print(json.dumps(analyzer.get_timeline(args.timeline, args.top, args.lib), indent=2))
+        else:
+            analyzer.print_timeline(args.timeline, args.top, args.lib)
         return
 
-    # JSON output
-    if args.json:
-        print(json.dumps(analyzer.to_json(), indent=2))
+    # Folded stacks
+    if args.folded:
+        if args.folded == "-":
+            analyzer.write_folded(sys.stdout, lib_filter=args.lib, by_thread=args.folded_threads)
+        else:
+            with open(args.folded, "w") as out:
+                lines = analyzer.write_folded(out, lib_filter=args.lib, by_thread=args.folded_threads)
+            print(f"Wrote {lines:,} stacks to {args.folded}", file=sys.stderr)
         return
 
-    # Callers/callees
-    if args.callers:
-        analyzer.print_callers(args.callers)
+    # Thread pools
+    if args.group_threads is not None:
+        patterns = args.group_threads or DEFAULT_THREAD_GROUPS
+        try:
+            if args.json:
+                print(json.dumps(analyzer.get_thread_groups(patterns, args.top), indent=2))
+            else:
+                analyzer.print_thread_groups(patterns)
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
         return
 
-    if args.callees:
-        analyzer.print_callees(args.callees)
+    # Crate/module roll-up
+    if args.crates:
+        if args.json:
+            print(json.dumps(analyzer.get_crate_rollup(args.tree_depth, args.min_pct), indent=2))
+        else:
+            analyzer.print_crate_rollup(max_depth=args.tree_depth, min_pct=args.min_pct)
         return
 
+    # Callers/callees and line/address hotspots
+    try:
+        if args.lines is not None or args.addresses is not None:
+            kind = "line" if args.lines is not None else "address"
+            func_name = (args.lines if kind == "line" else args.addresses) or None
+            if args.json:
+                print(json.dumps(analyzer.get_hot_locations(
+                    kind, by="self" if func_name is None else "total", top_n=args.top,
+                    lib_filter=args.lib, func_name=func_name, match=args.match), indent=2))
+            else:
+                analyzer.print_hot_locations(kind, top_n=args.top, lib_filter=args.lib,
+                                             func_name=func_name, match=args.match)
+            return
+
+        # JSON output
+        if args.json:
+            print(json.dumps(analyzer.to_json(), indent=2))
+            return
+
+        if args.callers:
+            analyzer.print_callers(args.callers, match=args.match)
+            return
+
+        if args.callees:
+            analyzer.print_callees(args.callees, match=args.match)
+            return
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
     # Call tree
+    if args.inverted:
+        analyzer.print_inverted_tree(max_depth=args.tree_depth, min_pct=args.min_pct)
+        return
+
     if args.tree:
         analyzer.print_call_tree(max_depth=args.tree_depth, min_pct=args.min_pct)
         return
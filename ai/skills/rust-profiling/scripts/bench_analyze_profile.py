@@ -0,0 +1,581 @@
+#!/usr/bin/env python3
+"""
+Benchmark for analyze_profile.py
+
+Builds synthetic samply/Firefox Profiler profiles (shared stack prefixes,
+recursion, raw-address frames, several libraries) and times the analyzer
+against a straightforward per-sample reference walk, checking that both
+produce identical FunctionStats.
+
+Usage:
+  bench_analyze_profile.py                          # Default sizes
+  bench_analyze_profile.py --samples 2000000        # Large profile
+  bench_analyze_profile.py --skip-reference         # Only time the analyzer
+  bench_analyze_profile.py --write profile.json     # Save the synthetic profile
+  bench_analyze_profile.py --compression            # Time plain vs gzip/zstd loading
+  bench_analyze_profile.py --threads 64 --jobs 1 2 4 8  # Worker scaling
+  bench_analyze_profile.py --lib-lookup 500         # Address -> library lookups and overlap cases
+  bench_analyze_profile.py --weighted               # Weighted vs unweighted aggregation
+  bench_analyze_profile.py --inline                 # Inlined frames, --inline expand vs collapse
+  bench_analyze_profile.py --functions 200000 --memory  # Memory held by analysis results
+  bench_analyze_profile.py --demangle               # Symbol demangling over a real-symbol corpus
+"""
+
+import argparse
+import contextlib
+import gzip
+import io
+import json
+import random
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from analyze_profile import (  # noqa: E402
+    LibraryIndex, ProfileAnalyzer, ProfileShell, demangle_rust, load_analyzer)
+
+
+def make_profile(threads: int = 4, samples: int = 200_000, functions: int = 2_000,
+                 stacks: int = 5_000, depth: int = 40, libs: int = 8,
+                 seed: int = 0, weighted: bool = False, inline: bool = False) -> dict:
+    """Generate a synthetic profile with realistic prefix sharing.
+
+    With weighted, samples also carry samply's weight and threadCPUDelta
+    columns. With inline, every function also gets an inlined frame
+    (inlineDepth 1, its own funcTable entry, the function's native symbol)
+    that stacks sometimes enter right below the physical frame.
+    """
+    rng = random.Random(seed)
+
+    lib_list = []
+    addr = 0x100000000
+    for i in range(libs):
+        size = rng.randrange(0x10000, 0x400000)
+        lib_list.append({"name": f"lib{i}.dylib", "start": addr, "end": addr + size})
+        addr += size + rng.randrange(0x1000, 0x100000)  # leave gaps between libs
+
+    profile_threads = []
+    for t in range(threads):
+        strings = []
+        func_names, ns_names, ns_libs, ns_addrs = [], [], [], []
+        frame_func, frame_ns, frame_addr = [], [], []
+        frame_depth = [0] * functions
+        for f in range(functions):
+            lib_idx = f % libs
+            lib = lib_list[lib_idx]
+            crate = f"crate{f % 17}"
+            if f % 11 == 0:
+                strings.append(f"{crate}::Type{f}$LT$T$GT$::run::h{f:016x}")
+            else:
+                strings.append(f"{crate}::module{f % 5}::func_{f}")
+            func_names.append(len(strings) - 1)
+            ns_names.append(len(strings) - 1)
+            ns_libs.append(lib_idx)
+            frame_addr_value = lib["start"] + rng.randrange(0, lib["end"] - lib["start"])
+            ns_addrs.append(frame_addr_value)
+            frame_func.append(f)
+            # Roughly one frame in twenty is unsymbolicated.
+            frame_ns.append(None if f % 20 == 19 else f)
+            frame_addr.append(frame_addr_value)
+        if inline:
+            for f in range(functions):
+                strings.append(f"crate{f % 17}::inlined::helper_{f}")
+                func_names.append(len(strings) - 1)
+                frame_func.append(len(func_names) - 1)
+                frame_ns.append(frame_ns[f])
+                frame_addr.append(frame_addr[f])
+                frame_depth.append(1)
+
+        # Each function calls a small fixed set of others; recursion is
+        # injected by occasionally re-entering an ancestor.
+        callees = [rng.sample(range(functions), 4) for _ in range(functions)]
+        stack_frame, stack_prefix = [], []
+        row_index: dict[tuple, int] = {}
+
+        def intern(prefix, frame):
+            key = (prefix, frame)
+            row = row_index.get(key)
+            if row is None:
+                row = len(stack_frame)
+                row_index[key] = row
+                stack_frame.append(frame)
+                stack_prefix.append(prefix)
+            return row
+
+        leaves = []
+        for _ in range(stacks):
+            frame = rng.randrange(min(16, functions))
+            row = intern(None, frame)
+            path = [frame]
+            for _ in range(rng.randrange(3, depth)):
+                if len(path) > 2 and rng.random() < 0.05:
+                    frame = rng.choice(path)
+                else:
+                    frame = rng.choice(callees[frame])
+                path.append(frame)
+                row = intern(row, frame)
+                if inline and rng.random() < 0.2:
+                    row = intern(row, functions + frame)
+            leaves.append(row)
+
+        weights = [1.0 / (i + 1) for i in range(len(leaves))]
+        per_thread = samples // threads
+        sample_stacks = rng.choices(leaves, weights=weights, k=per_thread)
+        for i in range(0, per_thread, 97):
+            sample_stacks[i] = None  # idle samples
+        sample_table = {
+            "stack": sample_stacks,
+            "time": [i * 1.0 for i in range(per_thread)],
+        }
+        if weighted:
+            sample_table["weight"] = [rng.choice((1, 1, 1, 2, 8)) for _ in range(per_thread)]
+            sample_table["weightType"] = "samples"
+            sample_table["threadCPUDelta"] = [None] + [rng.randrange(0, 1000) for _ in range(per_thread - 1)]
+        profile_threads.append({
+            "name": f"worker-{t}",
+            "stringArray": strings,
+            "funcTable": {"name": func_names},
+            "nativeSymbols": {"name": ns_names, "libIndex": ns_libs, "address": ns_addrs},
+            "frameTable": {"func": frame_func, "nativeSymbol": frame_ns, "address": frame_addr,
+                           **({"inlineDepth": frame_depth} if inline else {})},
+            "stackTable": {"frame": stack_frame, "prefix": stack_prefix},
+            "samples": sample_table,
+        })
+
+    return {"meta": {"interval": 1.0}, "libs": lib_list, "threads": profile_threads}
+
+
+def reference_analyze(analyzer: ProfileAnalyzer) -> None:
+    """Per-sample stack walk, kept as the correctness baseline.
+
+    Inlined frames are renamed after their own funcTable entry with
+    --inline expand and skipped with collapse, so their samples land on the
+    physical frame below.
+    """
+    column = {"auto": "weight", "weight": "weight", "cpu": "threadCPUDelta"}.get(analyzer.weight)
+    collapse = analyzer.inline == "collapse"
+    functions = analyzer.functions
+    for thread in analyzer.threads:
+        stack_table = thread.get('stackTable', {})
+        stack_frames = stack_table.get('frame', [])
+        stack_prefixes = stack_table.get('prefix', [])
+        frame_table = thread.get('frameTable', {})
+        frame_depths = frame_table.get('inlineDepth', [])
+        frame_funcs = frame_table.get('func', [])
+        func_names = thread.get('funcTable', {}).get('name', [])
+        strings = thread.get('stringArray', [])
+        samples = thread.get('samples', {})
+        stack_column = samples.get('stack', [])
+        weights = samples.get(column) if column else None
+        for i, stack_idx in enumerate(stack_column):
+            w = weights[i] if weights else 1
+            if stack_idx is None or not w:
+                continue
+            analyzer.total_samples += w
+            seen_in_stack = set()
+            seen_edges = set()
+            prev_name = None
+            current_idx = stack_idx
+            is_leaf = True
+            while current_idx is not None and current_idx < len(stack_frames):
+                frame_idx = stack_frames[current_idx]
+                inlined = frame_idx < len(frame_depths) and frame_depths[frame_idx] > 0
+                if not (inlined and collapse):
+                    name, lib = analyzer._resolve_frame_name(thread, frame_idx)
+                    if inlined:
+                        name = demangle_rust(strings[func_names[frame_funcs[frame_idx]]])
+                    fid = functions.intern(name, lib)
+                    if is_leaf:
+                        functions.self_samples[fid] += w
+                        is_leaf = False
+                    if name not in seen_in_stack:
+                        functions.total_samples[fid] += w
+                        seen_in_stack.add(name)
+                    if prev_name and prev_name != name and (name, prev_name) not in seen_edges:
+                        seen_edges.add((name, prev_name))
+                        functions.add_edge(fid, functions.ids[prev_name], w)
+                    prev_name = name
+                if current_idx < len(stack_prefixes):
+                    current_idx = stack_prefixes[current_idx]
+                else:
+                    break
+
+
+def snapshot(analyzer: ProfileAnalyzer) -> list:
+    """Comparable view of an analyzer's results, in registration order."""
+    return [
+        (f.name, f.library, f.self_samples, f.total_samples,
+         list(f.callers.items()), list(f.callees.items()))
+        for f in analyzer.functions.values()
+    ] + [analyzer.total_samples]
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def bench_compression(data: dict):
+    """Time loading the same profile as plain JSON, gzip and zstd."""
+    print(f"\n{'Format':<8} {'Size':>10} {'json.load':>10} {'--stream':>10}")
+    print(f"{'-'*42}")
+    with tempfile.TemporaryDirectory() as tmp:
+        text = json.dumps(data).encode()
+        paths = {"plain": Path(tmp) / "profile.json", "gzip": Path(tmp) / "profile.json.gz"}
+        paths["plain"].write_bytes(text)
+        paths["gzip"].write_bytes(gzip.compress(text, compresslevel=6))
+        try:
+            import zstandard
+        except ImportError:
+            print("(zstandard not installed, skipping zstd)", file=sys.stderr)
+        else:
+            paths["zstd"] = Path(tmp) / "profile.json.zst"
+            paths["zstd"].write_bytes(zstandard.ZstdCompressor(level=3).compress(text))
+
+        for fmt, path in paths.items():
+            times = []
+            for stream in (False, True):
+                opts = argparse.Namespace(stream=stream, thread=None, jobs=1, no_cache=True,
+                                          weight="auto", time_from=None, time_to=None,
+                                          timeline=None, lines=None, addresses=None,
+                                          inline="expand", export=None, tree=False,
+                                          inverted=False, folded=None, crates=False,
+                                          export_stacks=False, interactive=False)
+                times.append(timed(lambda: load_analyzer(path, opts)))
+            size = path.stat().st_size / 2**20
+            print(f"{fmt:<8} {size:>8.1f}MB {times[0]:>9.2f}s {times[1]:>9.2f}s")
+
+
+def bench_weights(data: dict):
+    """Time each --weight mode and check it against the reference walk."""
+    print(f"\n{'Weight':>8} {'Time':>9}  Match")
+    print(f"{'-'*26}")
+    for mode in ("samples", "weight", "cpu"):
+        analyzer = ProfileAnalyzer(data, weight=mode)
+        elapsed = timed(analyzer.analyze)
+        ref = ProfileAnalyzer(data, weight=mode)
+        reference_analyze(ref)
+        match = "yes" if snapshot(ref) == snapshot(analyzer) else "NO"
+        print(f"{mode:>8} {elapsed:>8.2f}s  {match}")
+
+
+def bench_inline(data: dict):
+    """Time each --inline mode and check it against the reference walk."""
+    print(f"\n{'Inline':>8} {'Time':>9}  Match")
+    print(f"{'-'*26}")
+    for mode in ("expand", "collapse"):
+        analyzer = ProfileAnalyzer(data, inline=mode)
+        elapsed = timed(analyzer.analyze)
+        ref = ProfileAnalyzer(data, inline=mode)
+        reference_analyze(ref)
+        match = "yes" if snapshot(ref) == snapshot(analyzer) else "NO"
+        print(f"{mode:>8} {elapsed:>8.2f}s  {match}")
+
+
+def bench_jobs(data: dict, jobs_list: list[int]):
+    """Time analysis across worker counts and check results match serial."""
+    print(f"\n{'Jobs':>6} {'Time':>9} {'Speedup':>8}  Match")
+    print(f"{'-'*34}")
+    serial = ProfileAnalyzer(data)
+    base = timed(serial.analyze)
+    expected = snapshot(serial)
+    for jobs in jobs_list:
+        analyzer = ProfileAnalyzer(data)
+        elapsed = timed(lambda: analyzer.analyze(jobs=jobs))
+        match = "yes" if snapshot(analyzer) == expected else "NO"
+        print(f"{jobs:>6} {elapsed:>8.2f}s {base / elapsed:>7.1f}x  {match}")
+
+
+def check_shell_diff() -> bool:
+    """Check that diffing in the shell leaves the loaded profile's totals alone.
+
+    The fixture's threads share one name, as a tokio pool's do, so diff
+    has same-named threads to fold together.
+    """
+    data = make_profile(threads=3, samples=3_000)
+    for thread in data["threads"]:
+        thread["name"] = "tokio-runtime-worker"
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "profile.json"
+        path.write_text(json.dumps(data))
+        args = argparse.Namespace(stream=False, thread=None, jobs=1, no_cache=True,
+                                  weight="auto", time_from=None, time_to=None,
+                                  timeline=None, lines=None, addresses=None,
+                                  inline="expand", export=None, tree=False,
+                                  inverted=False, folded=None, crates=False,
+                                  export_stacks=False, interactive=True, lib=None,
+                                  top=5, alpha=0.05)
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            shell = ProfileShell([path], args)
+            loaded = snapshot(shell.analyzer)
+            shell.onecmd(f"diff {path} {path}")
+            shell.onecmd("filter clear")
+    return snapshot(shell.analyzer) == loaded
+
+
+def bench_memory(data: dict):
+    """Measure memory allocated by analysis and kept by its results."""
+    analyzer = ProfileAnalyzer(data)
+    tracemalloc.start()
+    analyzer.analyze()
+    # Frame tables are a per-profile cache, not part of the results.
+    analyzer._frame_tables.clear()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"\nFunctions: {len(analyzer.functions):,}")
+    print(f"Retained: {current / 2**20:>8.1f} MiB")
+    print(f"Peak:     {peak / 2**20:>8.1f} MiB")
+
+
+def linear_addr_to_lib(libs_by_addr: list[tuple], addr: int) -> str:
+    """The original linear scan over libraries sorted by start address."""
+    for start, end, name in libs_by_addr:
+        if start <= addr:
+            if end is None or addr < end:
+                return name
+    return "unknown"
+
+
+# Hand-checked LibraryIndex cases: nested, partially overlapping, same-start
+# and open-ended ranges, with addresses in the gaps between them.
+LIB_LOOKUP_RANGES = [
+    (0x1000, 0x9000, "outer"),
+    (0x2000, 0x3000, "nested"),
+    (0x2800, 0x2900, "nested2"),
+    (0x8000, 0xa000, "partial"),
+    (0xb000, 0xc000, "same_wide"),
+    (0xb000, 0xb800, "same_narrow"),
+    (0xd000, 0xd400, "first_narrow"),
+    (0xd000, 0xe000, "first_wide"),
+    (0x20000, None, "open"),
+]
+LIB_LOOKUP_CASES = [
+    (0x0fff, "unknown"),
+    (0x1000, "outer"),
+    (0x1fff, "outer"),
+    (0x2000, "nested"),
+    (0x2850, "nested2"),
+    (0x2900, "nested"),
+    (0x3000, "outer"),
+    (0x8fff, "partial"),
+    (0x9000, "partial"),
+    (0xa000, "unknown"),
+    (0xb400, "same_narrow"),
+    (0xb900, "same_wide"),
+    (0xd200, "first_narrow"),
+    (0xd800, "first_wide"),
+    (0xf000, "unknown"),
+    (0x1ffff, "unknown"),
+    (0x20000, "open"),
+    (0xffffffffff, "open"),
+]
+
+
+def check_lib_lookup() -> list[tuple[int, str, str]]:
+    """(address, expected, got) for every hand-checked case LibraryIndex gets wrong."""
+    index = LibraryIndex(LIB_LOOKUP_RANGES)
+    return [(addr, expected, index.lookup(addr)) for addr, expected in LIB_LOOKUP_CASES
+            if index.lookup(addr) != expected]
+
+
+def bench_lib_lookup(n_libs: int, n_lookups: int = 200_000, seed: int = 0):
+    """Time linear scan vs LibraryIndex on gapped library ranges, and check
+    the overlapping-range cases."""
+    rng = random.Random(seed)
+    ranges, addr = [], 0x100000000
+    for i in range(n_libs):
+        size = rng.randrange(0x1000, 0x100000)
+        ranges.append((addr, addr + size, f"lib{i}"))
+        addr += size + rng.randrange(0, 0x10000)
+    addrs = [rng.randrange(0x100000000, addr + 0x100000) for _ in range(n_lookups)]
+    by_addr = sorted(ranges, key=lambda r: r[0])
+    index = LibraryIndex(ranges)
+
+    linear = timed(lambda: [linear_addr_to_lib(by_addr, a) for a in addrs])
+    indexed = timed(lambda: [index.lookup(a) for a in addrs])
+    match = "yes" if all(linear_addr_to_lib(by_addr, a) == index.lookup(a) for a in addrs[:20_000]) else "NO"
+    print(f"\n{'Libs':>6} {'Lookups':>9} {'Linear':>9} {'Bisect':>9} {'Speedup':>8}  Match")
+    print(f"{'-'*52}")
+    print(f"{n_libs:>6} {n_lookups:>9,} {linear:>8.2f}s {indexed:>8.3f}s {linear / indexed:>7.0f}x  {match}")
+
+    failures = check_lib_lookup()
+    print(f"\nOverlapping/gapped ranges: {len(LIB_LOOKUP_CASES) - len(failures)}/"
+          f"{len(LIB_LOOKUP_CASES)} cases {'match' if not failures else 'MISMATCH'}")
+    for addr, expected, got in failures:
+        print(f"  0x{addr:x}: expected {expected}, got {got}")
+
+
+def mangle_legacy(path: str, hash_: str) -> str:
+    """Legacy-mangle a path as rustc does (components are taken verbatim)."""
+    parts = path.split("::") + [f"h{hash_}"]
+    return "_ZN" + "".join(f"{len(p)}{p}" for p in parts) + "E"
+
+
+# Frame names as they appear in real samply profiles: legacy and v0 Rust
+# symbols, C++ symbols from libstdc++, names samply already demangled,
+# libc internals and unsymbolicated addresses.
+DEMANGLE_CORPUS = [
+    mangle_legacy("std::rt::lang_start::_$u7b$$u7b$closure$u7d$$u7d$", "6d3a1d2a8d6f0f3e"),
+    mangle_legacy("core::ptr::drop_in_place$LT$alloc..string..String$GT$", "0a1b2c3d4e5f6789"),
+    mangle_legacy("_$LT$alloc..vec..Vec$LT$T$C$A$GT$$u20$as$u20$core..ops..drop..Drop$GT$::drop",
+                  "9f8e7d6c5b4a3921"),
+    mangle_legacy("tokio::runtime::task::raw::poll", "5c1e2a3b4d5f6071"),
+    mangle_legacy("hashbrown::raw::RawTable$LT$T$C$A$GT$::reserve_rehash", "1234567890abcdef"),
+    mangle_legacy("serde_json::de::Deserializer$LT$R$GT$::parse_whitespace", "fedcba9876543210"),
+    mangle_legacy("std::sys::unix::thread::Thread::new::thread_start", "0011223344556677"),
+    mangle_legacy("_$LT$core..iter..adapters..map..Map$LT$I$C$F$GT$$u20$as$u20$"
+                  "core..iter..traits..iterator..Iterator$GT$::fold", "8899aabbccddeeff"),
+    "_RNvC6_123foo3bar",
+    "_RNqCs4fqI2P2rA04_11utf8_identsu30____7hkackfecea1cbdathfdh9hlq6y",
+    "_RNCNCNgCs6DXkGYLi8lr_2cc5spawn00B5_",
+    "_RNCINkXs25_NgCsbmNqQUJIY6D_4core5sliceINyB9_4IterhENuNgNoBb_4iter8iterator8Iterator"
+    "9rpositionNCNgNpB9_6memchr7memrchrs_0E0Bb_",
+    "_RINbNbCskIICzLVDPPb_5alloc5alloc8box_freeDINbNiB4_5boxed5FnBoxuEp6OutputuEL_"
+    "ECs1L9rLvVc1qo_3std",
+    "_RC3foo.llvm.9D1C9369",
+    "_ZNSt6vectorIiSaIiEE9push_backERKi",
+    "_ZNKSt7__cxx1112basic_stringIcSt11char_traitsIcESaIcEE4sizeEv",
+    "_ZSt4endlIcSt11char_traitsIcEERSt13basic_ostreamIT_T0_ES6_",
+    "_ZN9__gnu_cxx13new_allocatorIcE8allocateEmPKv",
+    "_ZNSt8ios_base4InitC1Ev",
+    "_Znwm",
+    "std::sys::unix::thread::Thread::new::thread_start::h1234567890abcdef",
+    "tokio::runtime::scheduler::multi_thread::worker::Context::run::h0fedcba987654321",
+    "<alloc::vec::Vec<T,A> as core::ops::drop::Drop>::drop",
+    "core::ptr::drop_in_place$LT$std..io..error..Error$GT$",
+    "__memmove_avx_unaligned_erms",
+    "_int_malloc",
+    "0x7ffd1a2b3c4d",
+]
+
+
+def original_demangle_rust(name: str) -> str:
+    """The original regex-and-replace simplifier, kept as the baseline."""
+    if not name:
+        return "unknown"
+    name = re.sub(r'::h[0-9a-f]{16}$', '', name)
+    name = name.replace('$LT$', '<').replace('$GT$', '>')
+    name = name.replace('$u20$', ' ').replace('$u27$', "'")
+    name = name.replace('$RF$', '&').replace('$BP$', '*')
+    name = name.replace('$C$', ',').replace('$SP$', '@')
+    if len(name) > 120:
+        if '<' in name:
+            base = name.split('<')[0]
+            name = f"{base}<...>"
+    return name
+
+
+def bench_demangle(visits: int = 200_000):
+    """Time demangling a stream of frame visits drawn from DEMANGLE_CORPUS."""
+    rng = random.Random(0)
+    stream = [rng.choice(DEMANGLE_CORPUS) for _ in range(visits)]
+
+    original = timed(lambda: [original_demangle_rust(s) for s in stream])
+    uncached = stream[:visits // 10]
+    demangle_rust.__wrapped__("_Znwm")  # load the C++ runtime outside the timing
+    cold = timed(lambda: [demangle_rust.__wrapped__(s) for s in uncached])
+    demangle_rust.cache_clear()
+    cached = timed(lambda: [demangle_rust(s) for s in stream])
+    changed = sum(1 for s in DEMANGLE_CORPUS if demangle_rust(s) != original_demangle_rust(s))
+
+    print(f"\n{'Demangler':<22} {'Symbols':>9} {'Time':>9} {'Per symbol':>11}")
+    print(f"{'-'*54}")
+    print(f"{'original':<22} {visits:>9,} {original:>8.3f}s {original / visits * 1e6:>9.2f}us")
+    print(f"{'full, uncached':<22} {len(uncached):>9,} {cold:>8.3f}s "
+          f"{cold / len(uncached) * 1e6:>9.2f}us")
+    print(f"{'full, LRU cache':<22} {visits:>9,} {cached:>8.3f}s {cached / visits * 1e6:>9.2f}us")
+    print(f"\n{changed} of {len(DEMANGLE_CORPUS)} corpus symbols now read differently:")
+    for symbol in DEMANGLE_CORPUS:
+        readable = demangle_rust(symbol)
+        if readable != original_demangle_rust(symbol):
+            print(f"  {readable}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark analyze_profile.py on synthetic profiles",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__
+    )
+    parser.add_argument("--samples", type=int, nargs="+", default=[100_000, 500_000],
+                        help="Sample counts to benchmark")
+    parser.add_argument("--threads", type=int, default=4, help="Threads per profile")
+    parser.add_argument("--functions", type=int, default=2_000, help="Unique functions per thread")
+    parser.add_argument("--depth", type=int, default=40, help="Maximum stack depth")
+    parser.add_argument("--skip-reference", action="store_true",
+                        help="Do not run the per-sample reference walk")
+    parser.add_argument("--write", help="Write the last generated profile to this path")
+    parser.add_argument("--jobs", type=int, nargs="+",
+                        help="Also time the last profile with these worker counts")
+    parser.add_argument("--weighted", action="store_true",
+                        help="Add weight/threadCPUDelta columns and time each --weight mode")
+    parser.add_argument("--inline", action="store_true",
+                        help="Add inlined frames and time each --inline mode")
+    parser.add_argument("--lib-lookup", type=int, metavar="N_LIBS",
+                        help="Microbenchmark address -> library lookup with N_LIBS libraries")
+    parser.add_argument("--compression", action="store_true",
+                        help="Also time loading the last profile as plain, gzip and zstd")
+    parser.add_argument("--demangle", action="store_true",
+                        help="Only benchmark symbol demangling over a corpus of real frame names")
+    parser.add_argument("--memory", action="store_true",
+                        help="Also measure memory held by the last profile's analysis (tracemalloc)")
+    args = parser.parse_args()
+
+    if args.lib_lookup:
+        bench_lib_lookup(args.lib_lookup)
+        return
+
+    if args.demangle:
+        bench_demangle()
+        return
+
+    print(f"{'Samples':>10} {'Reference':>11} {'Analyzer':>10} {'Speedup':>8}  Match")
+    print(f"{'-'*50}")
+    data = None
+    for n in args.samples:
+        data = make_profile(threads=args.threads, samples=n, functions=args.functions,
+                            depth=args.depth, weighted=args.weighted, inline=args.inline)
+
+        fast = ProfileAnalyzer(data)
+        fast_time = timed(fast.analyze)
+
+        if args.skip_reference:
+            print(f"{n:>10,} {'-':>11} {fast_time:>9.2f}s {'-':>8}  -")
+            continue
+
+        ref = ProfileAnalyzer(data)
+        ref_time = timed(lambda: reference_analyze(ref))
+        match = "yes" if snapshot(ref) == snapshot(fast) else "NO"
+        print(f"{n:>10,} {ref_time:>10.2f}s {fast_time:>9.2f}s {ref_time / fast_time:>7.1f}x  {match}")
+
+    print(f"\nShell diff keeps loaded totals: {'yes' if check_shell_diff() else 'NO'}")
+
+    if args.weighted and data is not None:
+        bench_weights(data)
+
+    if args.inline and data is not None:
+        bench_inline(data)
+
+    if args.jobs and data is not None:
+        bench_jobs(data, args.jobs)
+
+    if args.compression and data is not None:
+        bench_compression(data)
+
+    if args.memory and data is not None:
+        bench_memory(data)
+
+    if args.write and data is not None:
+        with open(args.write, "w") as f:
+            json.dump(data, f)
+        print(f"Wrote {args.write}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()